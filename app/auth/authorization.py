@@ -1,30 +1,97 @@
+import os
+import threading
+from typing import Dict, Any, Tuple
 from oso import Oso
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
 import logging
+from app.logging_config import SAMPLED
+from app.metrics import REGISTRY, cache_collector
 from app.models.user import User
 from app.auth.jwt import get_current_active_user
 from app.database import get_db
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+AUTHZ_DECISION_CACHE_ENABLED = os.getenv("AUTHZ_DECISION_CACHE_ENABLED", "true").lower() == "true"
+AUTHZ_DECISION_CACHE_MAX_ENTRIES = int(os.getenv("AUTHZ_DECISION_CACHE_MAX_ENTRIES", "4096"))
+
 oso = Oso()
 
+AUTHZ_SECONDS = REGISTRY.histogram(
+    "authz_oso_duration_seconds",
+    "Time Oso takes to evaluate an authorization decision (decision cache misses only).",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+
+# decisions for string resources ("document", "rag", "user_role", ...), keyed on
+# the user attributes app/policy.polar reads for them: role and is_active
+_decision_cache: Dict[Tuple, bool] = {}
+_decision_cache_lock = threading.Lock()
+_decision_cache_stats = {"hits": 0, "misses": 0}
+
+
+def clear_decision_cache():
+    """This function drops all memoized authorization decisions."""
+    with _decision_cache_lock:
+        _decision_cache.clear()
+
+
+def decision_cache_stats() -> Dict[str, Any]:
+    """This function returns hit/miss counters of the authorization decision cache."""
+    with _decision_cache_lock:
+        hits, misses = _decision_cache_stats["hits"], _decision_cache_stats["misses"]
+        lookups = hits + misses
+        return {
+            "enabled": AUTHZ_DECISION_CACHE_ENABLED,
+            "entries": len(_decision_cache),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+REGISTRY.register_collector(cache_collector("authz_decision", decision_cache_stats))
+
+
+def _is_allowed(user: User, action: str, resource) -> bool:
+    with AUTHZ_SECONDS.time():
+        return oso.is_allowed(user, action, resource)
+
+
 def init_oso():
     """This function initializes Oso with policy and classes."""
     from app.models.user import User
+    from app.services.jobs_model import IngestionJob
 
     oso.register_class(User)
+    oso.register_class(IngestionJob)
     oso.load_files(["app/policy.polar"])
+    clear_decision_cache()
     logger.info("Oso initialized")
 
 
 def authorize(user: User, action: str, resource) -> bool:
     """
     This function checks if a user is authorized to perform an action on a resource.
+    Decisions on string resources are memoized; instance resources always go through Oso.
     """
-    return oso.is_allowed(user, action, resource)
+    if not AUTHZ_DECISION_CACHE_ENABLED or not isinstance(resource, str):
+        return _is_allowed(user, action, resource)
+
+    key = (user.role, bool(user.is_active), action, resource)
+    with _decision_cache_lock:
+        decision = _decision_cache.get(key)
+        if decision is not None:
+            _decision_cache_stats["hits"] += 1
+            return decision
+        _decision_cache_stats["misses"] += 1
+
+    decision = _is_allowed(user, action, resource)
+    with _decision_cache_lock:
+        if len(_decision_cache) < AUTHZ_DECISION_CACHE_MAX_ENTRIES:
+            _decision_cache[key] = decision
+    return decision
 
 
 def require_permission(action: str, resource_type: str):
@@ -36,12 +103,12 @@ def require_permission(action: str, resource_type: str):
         db: Session = Depends(get_db)
     ):
         if not authorize(current_user, action, resource_type):
-            logger.error(f"User {current_user.id} is not authorized to {action} {resource_type}")
+            logger.error("User %s is not authorized to %s %s", current_user.id, action, resource_type)
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Not authorized to {action} {resource_type}"
             )
-        logger.info(f"User {current_user.id} is authorized to {action} {resource_type}")
+        logger.info("User %s is authorized to %s %s", current_user.id, action, resource_type, extra=SAMPLED)
         return current_user
     
     return check_permission
@@ -55,12 +122,12 @@ def check_resource_permission(action: str, resource):
         current_user: User = Depends(get_current_active_user)
     ):
         if not authorize(current_user, action, resource):
-            logger.error(f"User {current_user.id} is not authorized to {action} this resource")
+            logger.error("User %s is not authorized to %s this resource", current_user.id, action)
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Not authorized to {action} this resource"
             )
-        logger.info(f"User {current_user.id} is authorized to {action} this resource")
+        logger.info("User %s is authorized to %s this resource", current_user.id, action, extra=SAMPLED)
         return current_user
     
     return check_permission 
\ No newline at end of file
@@ -5,13 +5,14 @@ from typing import Optional, Dict, Any
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 import logging
 from app.database import get_db
 from app.models.user import User
+from app.auth.principal_cache import principal_cache
 from dotenv import load_dotenv
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -41,7 +42,15 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
     """
     This function gets the current user from the JWT token.
+    Validated tokens are served from the principal cache until they expire or the user changes.
     """
+    cached_user = principal_cache.get(
+        token,
+        lambda user_id: db.query(func.coalesce(User.version, 0)).filter(User.id == user_id).scalar()
+    )
+    if cached_user is not None:
+        return cached_user
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -65,7 +74,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         
     if not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Inactive user")
-        
+    
+    principal_cache.put(token, user, token_expires_at=payload.get("exp"))
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional, Set
+
+import logging
+from app.metrics import REGISTRY, cache_collector
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_ENABLED = os.getenv("PRINCIPAL_CACHE_ENABLED", "true").lower() == "true"
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+# how often a cached principal's version is compared with the database
+PRINCIPAL_CACHE_REVALIDATE_SECONDS = float(os.getenv("PRINCIPAL_CACHE_REVALIDATE_SECONDS", "1"))
+
+
+def snapshot_user(user: User) -> User:
+    """
+    This function copies a user's column values into a new, session-less User,
+    so the cached principal is unaffected by commits or closes of the session it came from.
+    """
+    return User(**{column.name: getattr(user, column.name) for column in User.__table__.columns})
+
+
+class PrincipalCache:
+    """
+    Bounded, TTL'd cache of authenticated users keyed by bearer token.
+
+    An entry never outlives its token's `exp` claim. Code that changes a user
+    in this process calls `invalidate_user`. Changes made elsewhere (another
+    worker, make_admin.py) bump the user's `version` column: a hit whose entry
+    was last checked over `revalidate_seconds` ago looks the version up and
+    drops the entry if it changed, so such changes apply within that interval.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS,
+        enabled: bool = PRINCIPAL_CACHE_ENABLED,
+        revalidate_seconds: float = PRINCIPAL_CACHE_REVALIDATE_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.revalidate_seconds = revalidate_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._stale = 0
+
+    def _remove(self, token: str):
+        user, _, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user.id]
+
+    def get(self, token: str, current_version: Optional[Callable[[int], Optional[int]]] = None) -> Optional[User]:
+        """
+        This function returns the cached principal for a token, or None. `current_version`
+        looks up a user's version in the database when the entry is due for revalidation.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self._misses += 1
+                return None
+            user, expires_at, checked_at = entry
+            if expires_at <= now:
+                self._remove(token)
+                self._misses += 1
+                return None
+            if current_version is None or now - checked_at < self.revalidate_seconds:
+                self._entries.move_to_end(token)
+                self._hits += 1
+                return user
+
+        # outside the lock: a primary key lookup of one column
+        version = current_version(user.id)
+        with self._lock:
+            # None: the user is gone; rows created before the version column have NULL (0)
+            if version is None or version != (user.version or 0):
+                if token in self._entries:
+                    self._remove(token)
+                self._stale += 1
+                self._misses += 1
+                return None
+            if token in self._entries:
+                self._entries[token] = (user, expires_at, now)
+                self._entries.move_to_end(token)
+            self._hits += 1
+            return user
+
+    def put(self, token: str, user: User, token_expires_at: Optional[float] = None):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        principal = snapshot_user(user)
+        with self._lock:
+            if token in self._entries:
+                self._remove(token)
+            self._entries[token] = (principal, expires_at, time.time())
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        """
+        This function drops every cached principal for a user.
+        """
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+            self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+            self._invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "stale": self._stale,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+
+principal_cache = PrincipalCache()
+REGISTRY.register_collector(cache_collector("principal", principal_cache.stats))
@@ -1,7 +1,36 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
 from passlib.context import CryptContext
 
+# bcrypt cost factor; hashes with any other cost are rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# number of hashes computed concurrently, and how many more may wait for a slot
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
 # Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+# bcrypt releases the GIL, so a thread pool is enough to keep hashing off the event loop
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending_hashes = 0
+_pending_lock = threading.Lock()
+
+
+class PasswordHasherBusyError(Exception):
+    """Raised when the password hashing queue is full."""
+
 
 def get_password_hash(password: str) -> str:
     """
@@ -26,4 +55,52 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     Returns:
         True if passwords match, False otherwise
     """
-    return pwd_context.verify(plain_password, hashed_password) 
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+async def _run_on_hash_pool(func, *args):
+    global _pending_hashes
+    with _pending_lock:
+        if _pending_hashes >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+            raise PasswordHasherBusyError("Too many password hashing requests in flight")
+        _pending_hashes += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, functools.partial(func, *args))
+    finally:
+        with _pending_lock:
+            _pending_hashes -= 1
+
+async def get_password_hash_async(password: str) -> str:
+    """
+    Hash a password for storing, on the bounded hashing pool.
+    
+    Args:
+        password: The plain-text password to hash
+    
+    Returns:
+        The hashed password
+    
+    Raises:
+        PasswordHasherBusyError: If the hashing queue is full
+    """
+    return await _run_on_hash_pool(pwd_context.hash, password)
+
+async def verify_and_update_password_async(
+    plain_password: str,
+    hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a stored password on the bounded hashing pool, rehashing it if its
+    parameters (e.g. bcrypt rounds) no longer match the configured ones.
+    
+    Args:
+        plain_password: The plain-text password to verify
+        hashed_password: The stored hashed password
+    
+    Returns:
+        (True if passwords match, the replacement hash to store or None)
+    
+    Raises:
+        PasswordHasherBusyError: If the hashing queue is full
+    """
+    return await _run_on_hash_pool(pwd_context.verify_and_update, plain_password, hashed_password)
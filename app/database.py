@@ -1,11 +1,12 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import logging  
 
-logging.basicConfig(level=logging.INFO)
+from app.metrics import track_db_queries
+
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -17,6 +18,8 @@ engine = create_engine(
     connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 )
 
+track_db_queries(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -29,7 +32,30 @@ def get_db():
         db.close()
 
 
+def _add_missing_columns():
+    """
+    create_all does not alter existing tables, so nullable columns added to a
+    model after its table was created are added here.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                if column.name in index.columns:
+                    index.create(bind=engine, checkfirst=True)
+            logger.info("Added column %s.%s", table.name, column.name)
+
+
 def init_db():
-    from app.models import user  
+    from app.models import user, document  
     Base.metadata.create_all(bind=engine) 
+    _add_missing_columns()
     logger.info("Database initialized successfully.")
\ No newline at end of file
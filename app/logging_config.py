@@ -0,0 +1,221 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from app.metrics import REGISTRY
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# written by the background listener thread; empty logs to stderr only
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+# per-logger levels, e.g. "sqlalchemy.engine=WARNING,app.services.rag_service=DEBUG"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# share of hot-path INFO records (logged with extra=SAMPLED) that are kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# records waiting for the writer thread; beyond this they are dropped rather than block the caller
+LOG_QUEUE_MAX_SIZE = int(os.getenv("LOG_QUEUE_MAX_SIZE", "10000"))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# pass as `extra=SAMPLED` on per-request INFO logs so LOG_SAMPLE_RATE applies to them
+SAMPLED = {"sampled": True}
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+_VALID_REQUEST_ID = re.compile(r"[\w\-.:]{1,128}")
+# attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: timestamp, level, logger, message, request_id,
+    exception text and any fields passed through `extra`.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "sampled":
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Runs on the thread that logs: stamps the request id and drops hot-path
+    records outside the sample, before anything is queued.
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False) and record.levelno <= logging.INFO and self.sample_rate < 1.0:
+            if random.random() >= self.sample_rate:
+                return False
+            record.sample_rate = self.sample_rate
+        request_id = request_id_var.get()
+        if request_id is not None:
+            record.request_id = request_id
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread. The message is rendered here, while its
+    arguments are still current, but formatting and I/O happen in the writer.
+    When the queue is full the record is dropped and counted instead of blocking.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_levels(levels: str) -> Dict[str, str]:
+    parsed = {}
+    for item in filter(None, (part.strip() for part in levels.split(","))):
+        name, _, level = item.partition("=")
+        parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def configure_logging():
+    """
+    This function routes all logging through a bounded queue to a background
+    writer thread, so request handlers never wait on disk or terminal I/O. Safe
+    to call more than once; only the first call configures anything.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s",
+        defaults={"request_id": "-"}
+    )
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(LOG_QUEUE_MAX_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter(LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    # uvicorn installs its own synchronous stream handlers; send its records through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # at interpreter exit rather than in the app's shutdown hook, so records logged by later
+    # shutdown hooks and by uvicorn while it stops are still written
+    atexit.register(shutdown_logging)
+    REGISTRY.register_collector(lambda: [
+        ("log_records_queued", "gauge", "Log records waiting for the writer thread.", [({}, log_queue.qsize())]),
+        ("log_records_dropped_total", "counter", "Log records dropped because the queue was full.", [({}, queue_handler.dropped)]),
+    ])
+
+
+def shutdown_logging():
+    """
+    This function writes out the queued records and stops the writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware giving each request an id, taken from a well-formed incoming
+    X-Request-ID header or generated, that every log record made while handling
+    the request carries and that is echoed back in the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if request_id is None or not _VALID_REQUEST_ID.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        header = (REQUEST_ID_HEADER.lower().encode(), request_id.encode())
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
@@ -1,22 +1,38 @@
+import asyncio
 import logging
-from fastapi import FastAPI
+import secrets
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
 
 from app.database import init_db
+from app.logging_config import configure_logging, RequestIdMiddleware
+from app.metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware
 from app.routers import auth, users, rag
 from app.auth.authorization import init_oso
+from app.services.ingestion_jobs import shutdown_ingestion_workers, backfill_legacy_documents
+from app.services.rag_service import (
+    warm_up, model_status, close_models, close_llm_provider, persist_scheduler, CHROMA_PERSIST_DIRECTORY
+)
+from app.services.vector_index import lock_index_directory
+from app.services.context_builder import token_counter_description
 from dotenv import load_dotenv
 from datetime import datetime
 
-logging.basicConfig(filename='app.log', level=logging.INFO)
-logging.info(f"Starting the application at {datetime.now()}")
+configure_logging()
 logger = logging.getLogger(__name__)
+logger.info("Starting the application at %s", datetime.now())
 
 load_dotenv()
 
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://localhost:8000")
 allowed_origins = ALLOWED_ORIGINS.split(",")
+# load the embedding model, vector index and LLM client at startup instead of on first use
+RAG_WARMUP = os.getenv("RAG_WARMUP", "false").lower() == "true"
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# when set, scrapers must send "Authorization: Bearer <token>" to read /metrics
+METRICS_BEARER_TOKEN = os.getenv("METRICS_BEARER_TOKEN")
 
 app = FastAPI(
     title="FastAPI RAG RBAC Service",
@@ -25,14 +41,22 @@ app = FastAPI(
 )
 
 
+# turns oversize uploads away before their body is read; inside CORS so the 413 carries its headers
+app.add_middleware(rag.UploadSizeLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
     allow_credentials=True, 
     allow_methods=["*"], # TODO: Restrict this to only the necessary methods
     allow_headers=["*"], # TODO: Restrict this to only the necessary headers
+    expose_headers=["X-Request-ID"],
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+# outermost, so records logged by the other middleware carry the request id too
+app.add_middleware(RequestIdMiddleware)
+
 
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -41,11 +65,60 @@ app.include_router(rag.router)
 
 @app.on_event("startup")
 async def startup_event():
+    # refuses to start while ingest_documents.py is writing the index; held until shutdown
+    app.state.index_lock = lock_index_directory(CHROMA_PERSIST_DIRECTORY)
     init_db()
     init_oso()
+    # one-off migration of chunks indexed before they carried document ids; awaited so no
+    # request sees the legacy documents of their owners hidden by the document_id filter
+    await asyncio.get_running_loop().run_in_executor(None, backfill_legacy_documents)
+    logger.info("Context tokens are counted with %s", token_counter_description())
+    if RAG_WARMUP:
+        # runs in the background so the server accepts connections meanwhile; /ready reports progress
+        app.state.warmup = asyncio.get_running_loop().run_in_executor(None, warm_up)
     logger.info("Application started successfully.")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_ingestion_workers(wait=True)
+    # force out index writes still waiting for a coalesced persist
+    persist_scheduler.close()
+    close_models()
+    await close_llm_provider()
+    app.state.index_lock.close()
+    logger.info("Application shut down.")
+
+
 @app.get("/", tags=["Root"])
 async def root():
-    return {"message": "Welcome to the FastAPI RAG RBAC Service Demo"} 
\ No newline at end of file
+    return {"message": "Welcome to the FastAPI RAG RBAC Service Demo"} 
+
+
+@app.get("/ready", tags=["Root"])
+async def ready():
+    """
+    To check readiness. With RAG_WARMUP enabled the service is ready once its models
+    are loaded; otherwise models load lazily on first use and it is always ready.
+    """
+    status = model_status()
+    warmup = getattr(app.state, "warmup", None)
+    if warmup is not None and warmup.done() and warmup.exception() is not None:
+        status["warmup_error"] = str(warmup.exception())
+    is_ready = not RAG_WARMUP or (status["embeddings_loaded"] and status["vector_index_loaded"])
+    return JSONResponse(status_code=200 if is_ready else 503, content={"ready": is_ready, **status})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """
+    To scrape Prometheus metrics: request latency and counts per route, per-stage
+    query and ingestion timings, authorization latency, cache hit rates and more.
+    """
+    if not METRICS_ENABLED:
+        return PlainTextResponse("Metrics are disabled", status_code=404)
+    if METRICS_BEARER_TOKEN and not secrets.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {METRICS_BEARER_TOKEN}"
+    ):
+        return PlainTextResponse("Unauthorized", status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
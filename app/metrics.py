@@ -0,0 +1,332 @@
+import bisect
+import contextvars
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# the response adds "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# seconds, from sub-millisecond cache hits to minute-long ingestion batches
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    """
+    Cumulative bucket counts plus sum and count, Prometheus style.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self) -> "_Timer":
+        """Observes the seconds spent in a `with` block, whether or not it raises."""
+        return _Timer(self)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            cumulative, running = {}, 0
+            for bound, count in zip(self.buckets + (float("inf"),), self._counts):
+                running += count
+                cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+            return {"buckets": cumulative, "sum": self._sum, "count": self._count}
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge(Counter):
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class MetricFamily:
+    """
+    A named metric with one series per combination of label values. Unlabelled
+    families can be used directly (`family.inc()`, `family.observe(...)`).
+    """
+
+    def __init__(self, name: str, documentation: str, metric_type: str, label_names: Sequence[str], factory: Callable):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def samples(self) -> List[Tuple[Dict[str, str], Any]]:
+        return [(dict(zip(self.label_names, values)), child) for values, child in list(self._children.items())]
+
+
+# a collector returns (name, type, documentation, [(labels, value or Histogram), ...]) tuples
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], Any]]]]]
+
+
+class MetricsRegistry:
+    """
+    Prometheus-style metrics kept in process and rendered in the text exposition
+    format at /metrics.
+
+    Updating a metric is a dict lookup and a locked add, so instrumentation can sit
+    on every request. Components that already keep their own counters (caches, the
+    persist scheduler, ...) register a collector instead, which is only called when
+    /metrics is scraped.
+    """
+
+    def __init__(self):
+        self._families: Dict[str, MetricFamily] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def _register(self, name: str, documentation: str, metric_type: str, label_names: Sequence[str], factory: Callable) -> MetricFamily:
+        with self._lock:
+            if name in self._families:
+                raise ValueError(f"Metric {name} is already registered")
+            family = MetricFamily(name, documentation, metric_type, label_names, factory)
+            self._families[name] = family
+            return family
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> MetricFamily:
+        return self._register(name, documentation, "counter", label_names, Counter)
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> MetricFamily:
+        return self._register(name, documentation, "gauge", label_names, Gauge)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> MetricFamily:
+        return self._register(name, documentation, "histogram", label_names, lambda: Histogram(buckets))
+
+    def register_collector(self, collector: Collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        This function renders every metric in the Prometheus text exposition format.
+        """
+        families: Dict[str, Tuple[str, str, List[Tuple[Dict[str, str], Any]]]] = {}
+        with self._lock:
+            registered, collectors = list(self._families.values()), list(self._collectors)
+        for family in registered:
+            families[family.name] = (family.metric_type, family.documentation, family.samples())
+        for collector in collectors:
+            for name, metric_type, documentation, samples in collector():
+                # several collectors may contribute series to one family, e.g. cache_hits_total
+                families.setdefault(name, (metric_type, documentation, []))[2].extend(samples)
+
+        lines = []
+        for name, (metric_type, documentation, samples) in families.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                if isinstance(value, Histogram):
+                    snapshot = value.snapshot()
+                    for bound, count in snapshot["buckets"].items():
+                        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(snapshot['sum'])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+                else:
+                    if isinstance(value, Counter):
+                        value = value.value
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+
+def cache_collector(cache: str, stats: Callable[[], Optional[Dict[str, Any]]]) -> Collector:
+    """
+    This function turns a cache's stats() (hits, misses and optionally entries,
+    evictions) into the shared cache_* families, labelled with the cache name.
+    `stats` may return None while the cache does not exist yet.
+    """
+    def collect():
+        values = stats()
+        if not values:
+            return []
+        labels = {"cache": cache}
+        families = [
+            ("cache_hits_total", "counter", "Cache lookups answered from the cache.", [(labels, values["hits"])]),
+            ("cache_misses_total", "counter", "Cache lookups that missed.", [(labels, values["misses"])]),
+        ]
+        if "entries" in values:
+            families.append(("cache_entries", "gauge", "Entries currently cached.", [(labels, values["entries"])]))
+        if "evictions" in values:
+            families.append(("cache_evictions_total", "counter", "Entries evicted to stay within bounds.", [(labels, values["evictions"])]))
+        return families
+
+    return collect
+
+
+# HTTP requests, recorded by MetricsMiddleware
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the response is fully sent.",
+    ("method", "route")
+)
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests being handled.")
+HTTP_REQUEST_DB_QUERIES = REGISTRY.histogram(
+    "http_request_db_queries",
+    "Database statements executed per HTTP request.",
+    ("route",),
+    buckets=COUNT_BUCKETS
+)
+DB_QUERIES = REGISTRY.counter("db_queries_total", "Database statements executed.")
+
+# statement counter of the request being handled; a list so threads it is copied to add to the same count
+_request_db_queries: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("request_db_queries", default=None)
+
+
+def track_db_queries(engine):
+    """
+    This function counts the statements `engine` executes, in total and per request.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERIES.inc()
+        counter = _request_db_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, latency, in-flight requests and
+    database statements per route. Routes are labelled by their path template
+    (/rag/documents/{document_id}), so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[Any, str] = {}
+
+    def _route(self, scope) -> str:
+        # the router leaves the matched endpoint in the scope, which saves matching every route again here
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            router = getattr(scope.get("app"), "router", None)
+            for route in getattr(router, "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            else:
+                path = "unmatched"
+            self._route_paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        db_queries = [0]
+        token = _request_db_queries.set(db_queries)
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = self._route(scope)
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route).observe(elapsed)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status[0])).inc()
+            HTTP_REQUEST_DB_QUERIES.labels(route).observe(db_queries[0])
+            _request_db_queries.reset(token)
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, or_
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
 from app.database import Base
 
+# status of a row whose ingestion job is still writing its chunks
+INGESTING = "ingesting"
+
 class Document(Base):
     __tablename__ = "documents"
     
@@ -12,6 +15,19 @@ class Document(Base):
     description = Column(Text, nullable=True)
     file_path = Column(String(255))
     file_type = Column(String(50))
+    # vector index partition (Chroma collection) holding this document's chunks: its
+    # uploader's, or a per-document doc_* one for documents indexed before partitions
+    # were grouped by uploader; NULL for documents in the legacy single collection
+    collection_name = Column(String(63), nullable=True, index=True)
+    # SHA-256 of the uploaded file, set once its ingestion has completed; repeat
+    # uploads of the same content share the first upload's chunks and file
+    content_hash = Column(String(64), nullable=True, index=True)
+    # the document whose chunks (tagged with its id) this repeat upload shares; NULL
+    # when the document's chunks carry its own id
+    source_document_id = Column(Integer, nullable=True, index=True)
+    # INGESTING while the upload's ingestion job runs, "completed" afterwards; NULL for
+    # documents written in one transaction (bulk loads, rows predating job status)
+    status = Column(String(20), nullable=True)
     uploader_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -20,4 +36,9 @@ class Document(Base):
     uploader = relationship("User", back_populates="documents")
     
     def __repr__(self):
-        return f"<Document(id={self.id}, title={self.title}, uploader_id={self.uploader_id})>" 
\ No newline at end of file
+        return f"<Document(id={self.id}, title={self.title}, uploader_id={self.uploader_id})>"
+
+
+def is_ingested():
+    """SQL condition matching documents whose ingestion has finished."""
+    return or_(Document.status.is_(None), Document.status != INGESTING) 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, event
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -14,9 +14,16 @@ class User(Base):
     role = Column(String, default="user")  # e.g., "admin", "user", "moderator"
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # bumped on every ORM update, so principal caches in any process can tell a cached copy is stale
+    version = Column(Integer, nullable=True, default=1)
     
     # Relationship with Document
     documents = relationship("Document", back_populates="uploader")
     
     def __repr__(self):
-        return f"<User(id={self.id}, username={self.username}, email={self.email}, role={self.role})>" 
\ No newline at end of file
+        return f"<User(id={self.id}, username={self.username}, email={self.email}, role={self.role})>" 
+
+
+@event.listens_for(User, "before_update")
+def _bump_version(mapper, connection, target):
+    target.version = (target.version or 0) + 1
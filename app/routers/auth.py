@@ -3,12 +3,18 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 import logging
 from app.database import get_db
+from app.logging_config import SAMPLED
 from app.models.user import User
-from app.auth.security import get_password_hash, verify_password
+from app.auth.security import (
+    get_password_hash_async,
+    verify_and_update_password_async,
+    PasswordHasherBusyError,
+)
 from app.auth.jwt import create_access_token
+from app.auth.authorization import require_permission
+from app.auth.principal_cache import principal_cache
 from pydantic import BaseModel, EmailStr, Field
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
@@ -18,6 +24,13 @@ class UserCreate(BaseModel):
     email: EmailStr
     password: str = Field(..., min_length=6)
 
+def _hasher_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -39,7 +52,11 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
             detail="Email already registered"
         )
     
-    hashed_password = get_password_hash(user.password)
+    try:
+        hashed_password = await get_password_hash_async(user.password)
+    except PasswordHasherBusyError:
+        logger.warning("Password hashing queue full, rejecting registration")
+        raise _hasher_busy_exception()
     db_user = User(
         username=user.username,
         email=user.email,
@@ -50,7 +67,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    logger.info(f"User {db_user.username} registered successfully")
+    logger.info("User %s registered successfully", db_user.username)
     
     return {"message": "User registered successfully", "user_id": db_user.id}
 
@@ -62,7 +79,11 @@ async def login_for_access_token(
     """
     To authenticate user and return JWT token.
     """
-    user = authenticate_user(form_data.username, form_data.password, db)
+    try:
+        user = await authenticate_user(form_data.username, form_data.password, db)
+    except PasswordHasherBusyError:
+        logger.warning("Password hashing queue full, rejecting login")
+        raise _hasher_busy_exception()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -71,17 +92,35 @@ async def login_for_access_token(
         )
     
     access_token = create_access_token(data={"sub": str(user.id)})
-    logger.info(f"User {user.username} authenticated successfully")
+    logger.info("User %s authenticated successfully", user.username, extra=SAMPLED)
     return {"access_token": access_token, "token_type": "bearer"}
 
-def authenticate_user(username: str, password: str, db: Session) -> User:
+async def authenticate_user(username: str, password: str, db: Session) -> User:
     """
     To authenticate a user by username and password.
+    The stored hash is upgraded transparently when the bcrypt cost has changed.
     """
     user = db.query(User).filter(User.username == username).first()
     
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
+        return None
+    is_valid, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not is_valid:
         return None
     if not user.is_active:
         return None
-    return user 
\ No newline at end of file
+    if new_hash:
+        user.hashed_password = new_hash
+        db.commit()
+        logger.info("Password hash of user %s upgraded", user.username)
+    return user
+
+
+@router.get("/cache/stats")
+async def principal_cache_stats(
+    current_user: User = Depends(require_permission("read", "metrics"))
+):
+    """
+    To get principal cache hit/miss counters. Requires admin role.
+    """
+    return principal_cache.stats()
@@ -1,20 +1,51 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
+from datetime import datetime
+import os
+import json
 import logging
+import uuid
 from app.database import get_db
+from app.logging_config import SAMPLED
 from app.models.user import User
-from app.models.document import Document
+from app.models.document import Document, is_ingested
 from app.auth.jwt import get_current_active_user
 from app.auth.authorization import authorize, require_permission
-from app.services.rag_service import process_document, query_documents
-from pydantic import BaseModel
+from app.services.rag_service import (
+    query_documents,
+    query_documents_batch,
+    stream_query_documents,
+    delete_document_index,
+    query_batcher,
+    persist_scheduler,
+    llm_status,
+    reranker_status,
+    save_upload,
+    UploadTooLargeError,
+    MAX_UPLOAD_SIZE,
+    MAX_UPLOAD_BODY_OVERHEAD,
+    RAG_RERANK_MAX_CANDIDATES,
+)
+from app.services.vector_index import LEGACY_PARTITION, is_document_partition, uploader_partition_name
+from app.services.ingestion_jobs import (
+    submit_ingestion_job,
+    get_ingestion_job,
+    find_duplicate_document,
+    record_duplicate_upload,
+)
+from app.services.llm_providers import LLMProviderError, LLMUnavailableError
+from app.services.answer_cache import answer_cache
+from pydantic import BaseModel, Field
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/rag", tags=["RAG"])
 
+RAG_BATCH_MAX_QUERIES = int(os.getenv("RAG_BATCH_MAX_QUERIES", "256"))
+
 class DocumentResponse(BaseModel):
     id: int
     title: str
@@ -25,9 +56,36 @@ class DocumentResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    status: str
+    stage: str
+    filename: str
+    title: str
+    uploader_id: int
+    content_hash: Optional[str] = None
+    deduplicated: bool = False
+    pages_parsed: int
+    chunks_total: int
+    chunks_embedded: int
+    durable: bool
+    document_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
 class QueryRequest(BaseModel):
     query: str
     top_k: Optional[int] = 5
+    document_ids: Optional[List[int]] = None
+    # None uses the server default (RAG_RETRIEVAL_STRATEGY)
+    retrieval: Optional[Literal["vector", "bm25", "hybrid"]] = None
+    # reciprocal rank fusion weights for hybrid retrieval
+    vector_weight: float = Field(1.0, ge=0)
+    bm25_weight: float = Field(1.0, ge=0)
+    # None uses the server default (RAG_RERANK, RAG_RERANK_CANDIDATES)
+    rerank: Optional[bool] = None
+    rerank_candidates: Optional[int] = Field(None, ge=1, le=RAG_RERANK_MAX_CANDIDATES)
 
 class SourceResponse(BaseModel):
     content: str
@@ -39,8 +97,104 @@ class QueryResponse(BaseModel):
     sources: List[SourceResponse]
     num_results: int
 
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest] = Field(..., min_length=1, max_length=RAG_BATCH_MAX_QUERIES)
+
+class BatchQueryItem(BaseModel):
+    result: Optional[QueryResponse] = None
+    error: Optional[str] = None
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryItem]
+
+
+def _search_partitions(
+    user: User,
+    db: Session,
+    document_ids: Optional[List[int]] = None
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    This function selects the index partitions a user's RAG search fans out over.
+    It mirrors list_documents: admins and moderators search every document, other
+    users only the documents they uploaded, optionally narrowed to `document_ids`.
+    Unrestricted searches take whole partitions (one per uploader); otherwise the
+    uploader and legacy partitions are filtered on the document_id their chunks
+    carry. Per-document doc_* partitions hold one document's content and are
+    never filtered.
+    """
+    privileged = user.role in ["admin", "moderator"]
+    unrestricted = privileged and document_ids is None
+    if unrestricted:
+        # one row per partition rather than per document
+        query = db.query(Document.collection_name).filter(is_ingested()).distinct()
+        partitions: Dict[str, Optional[Dict[str, Any]]] = {
+            collection_name or LEGACY_PARTITION: None for collection_name, in query.all()
+        }
+        partitions[LEGACY_PARTITION] = None
+        return partitions
+
+    query = db.query(Document.id, Document.source_document_id, Document.collection_name).filter(is_ingested())
+    if not privileged:
+        query = query.filter(Document.uploader_id == user.id)
+    if document_ids is not None:
+        query = query.filter(Document.id.in_(document_ids))
+    
+    partitions = {}
+    chunk_owners: Dict[str, List[int]] = {}
+    for document_id, source_document_id, collection_name in query.all():
+        if collection_name and is_document_partition(collection_name):
+            partitions[collection_name] = None
+        else:
+            # repeat uploads search the chunks of the document they share
+            chunk_owners.setdefault(collection_name or LEGACY_PARTITION, []).append(source_document_id or document_id)
+    for name, owner_ids in chunk_owners.items():
+        partitions[name] = {"document_id": {"$in": sorted(set(owner_ids))}}
+    return partitions
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware refusing upload bodies larger than MAX_UPLOAD_SIZE (plus
+    MAX_UPLOAD_BODY_OVERHEAD for the multipart framing) before the form parser
+    spools them to disk: up front when the Content-Length header is over the
+    limit, otherwise as soon as the bytes received pass it.
+    """
+
+    def __init__(self, app, path: str = f"{router.prefix}/upload", max_body_size: int = MAX_UPLOAD_SIZE + MAX_UPLOAD_BODY_OVERHEAD):
+        self.app = app
+        self.path = path
+        self.max_body_size = max_body_size
 
-@router.post("/upload", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"File exceeds the maximum upload size of {MAX_UPLOAD_SIZE} bytes"
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_body_size:
+                logger.error("Upload rejected: Content-Length %s exceeds the limit", value.decode())
+                response = JSONResponse({"detail": detail}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def receive_with_limit():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    logger.error("Upload rejected after %s bytes", received)
+                    # raised into the form parser; FastAPI passes HTTPExceptions through to the handler
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+            return message
+
+        await self.app(scope, receive_with_limit, send)
+
+
+@router.post("/upload", response_model=IngestionJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(
     file: UploadFile = File(...),
     title: str = Form(...),
@@ -49,10 +203,13 @@ async def upload_document(
     db: Session = Depends(get_db)
 ):
     """
-    To upload and process a document for RAG.
+    To upload a document and queue it for RAG processing. Poll /rag/jobs/{job_id} for progress;
+    `durable` turns true once the document's chunks have been persisted.
+    Content that is already indexed is not processed again: the new document shares
+    the existing chunks and its job is returned completed.
     """
     if not authorize(current_user, "upload", "document"):
-        logger.error(f"User {current_user.username} not authorized to upload documents")
+        logger.error("User %s not authorized to upload documents", current_user.username)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to upload documents"
@@ -60,43 +217,86 @@ async def upload_document(
     
     file_extension = file.filename.split('.')[-1].lower()
     if file_extension not in ["pdf", "txt"]:
-        logger.error(f"Unsupported file type: {file_extension}")
+        logger.error("Unsupported file type: %s", file_extension)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Unsupported file type. Only PDF and TXT files are supported."
         )
     
-    content = await file.read()
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        logger.error("Upload of %s bytes exceeds the limit", file.size)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the maximum upload size of {MAX_UPLOAD_SIZE} bytes"
+        )
     
     try:
-        doc_metadata = await process_document(
-            content=content,
+        stored = await save_upload(file, file_extension, uuid.uuid4().hex)
+    except UploadTooLargeError as e:
+        logger.error("Upload rejected: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    
+    original = find_duplicate_document(db, stored["content_hash"])
+    if original is not None:
+        os.unlink(stored["file_path"])
+        return record_duplicate_upload(
+            db,
+            original,
             filename=file.filename,
             title=title,
+            uploader_id=current_user.id,
             description=description
-        )
-        db_document = Document(
+        ).to_dict()
+    
+    try:
+        job = submit_ingestion_job(
+            file_path=stored["file_path"],
+            collection_name=uploader_partition_name(current_user.id),
+            filename=file.filename,
             title=title,
+            uploader_id=current_user.id,
             description=description,
-            file_path=doc_metadata["file_path"],
-            file_type=doc_metadata["file_type"],
-            uploader_id=current_user.id
-        )
-        
-        db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
-        logger.info(f"Document {db_document.title} uploaded successfully by user {current_user.username}")
-        
-        return db_document
+            content_hash=stored["content_hash"]
+        )
+        logger.info("Document %s queued as job %s by user %s", title, job.id, current_user.username)
+        return job.to_dict()
     
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing document: {str(e)}"
+            detail=f"Error queueing document: {str(e)}"
         )
 
 
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    To get the status and progress of a document ingestion job.
+    """
+    job = get_ingestion_job(job_id)
+    
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    if not authorize(current_user, "read", job):
+        logger.error("User %s not authorized to read job %s", current_user.username, job_id)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to read this job"
+        )
+    
+    return job.to_dict()
+
+
 @router.get("/documents", response_model=List[DocumentResponse])
 async def list_documents(
     skip: int = 0,
@@ -108,46 +308,271 @@ async def list_documents(
     To list all accessible documents.
     """
     if not authorize(current_user, "read", "document"):
-        logger.error(f"User {current_user.username} not authorized to access documents")
+        logger.error("User %s not authorized to access documents", current_user.username)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to access documents"
         )
     
     if current_user.role in ["admin", "moderator"]:
-        documents = db.query(Document).offset(skip).limit(limit).all()
+        documents = db.query(Document).filter(is_ingested()).offset(skip).limit(limit).all()
     else:
-        documents = db.query(Document).filter(Document.uploader_id == current_user.id).offset(skip).limit(limit).all()
+        documents = db.query(Document).filter(
+            Document.uploader_id == current_user.id,
+            is_ingested()
+        ).offset(skip).limit(limit).all()
     
-    logger.info(f"Listed {len(documents)} documents for user {current_user.username}")
+    logger.info("Listed %s documents for user %s", len(documents), current_user.username, extra=SAMPLED)
     return documents
 
 
+@router.delete("/documents/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_document(
+    document_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    To delete a document together with its chunks and stored file. Requires admin role.
+    Chunks and a file shared with deduplicated uploads are kept until the last
+    document using them is deleted.
+    """
+    if not authorize(current_user, "delete", "document"):
+        logger.error("User %s not authorized to delete documents", current_user.username)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to delete documents"
+        )
+    
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    others = db.query(Document).filter(Document.id != document.id)
+    chunk_owner_id = document.source_document_id or document.id
+    if document.collection_name and is_document_partition(document.collection_name):
+        chunks_shared = others.filter(Document.collection_name == document.collection_name).count() > 0
+    else:
+        chunks_shared = others.filter(
+            (Document.id == chunk_owner_id) | (Document.source_document_id == chunk_owner_id)
+        ).count() > 0
+    file_shared = others.filter(Document.file_path == document.file_path).count() > 0
+    
+    try:
+        if not chunks_shared:
+            await run_in_threadpool(delete_document_index, document.collection_name, chunk_owner_id)
+        if not file_shared and document.file_path and os.path.exists(document.file_path):
+            os.unlink(document.file_path)
+    except Exception as e:
+        logger.error("Error deleting document %s: %s", document_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error deleting document: {str(e)}"
+        )
+    
+    db.delete(document)
+    db.commit()
+    logger.info("Document %s deleted by user %s", document_id, current_user.username)
+
+
 @router.post("/query", response_model=QueryResponse)
 async def query_rag(
     query_request: QueryRequest,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
 ):
     """
     To query documents using RAG.
     """
     if not authorize(current_user, "use", "rag"):
-        logger.error(f"User {current_user.username} not authorized to use RAG")
+        logger.error("User %s not authorized to use RAG", current_user.username)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to use RAG"
         )
+    partitions = _search_partitions(current_user, db, query_request.document_ids)
+    # hand the connection back to the pool instead of holding it through generation
+    db.close()
     try:
         results = await query_documents(
             query=query_request.query,
-            top_k=query_request.top_k
+            top_k=query_request.top_k,
+            partitions=partitions,
+            retrieval=query_request.retrieval,
+            vector_weight=query_request.vector_weight,
+            bm25_weight=query_request.bm25_weight,
+            rerank=query_request.rerank,
+            rerank_candidates=query_request.rerank_candidates
+        )
+        # the query text itself stays out of the logs
+        logger.info(
+            "Query of %s characters executed successfully by user %s (%s results)",
+            len(query_request.query), current_user.username, results["num_results"], extra=SAMPLED
         )
-        logger.info(f"Query {query_request.query} executed successfully by user {current_user.username}")
         return results
     
+    except LLMUnavailableError as e:
+        logger.error("Error generating answer: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Error generating answer: {str(e)}"
+        )
+    except LLMProviderError as e:
+        logger.error("Error generating answer: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Error generating answer: {str(e)}"
+        )
     except Exception as e:
-        logger.error(f"Error querying documents: {str(e)}")
+        logger.error("Error querying documents: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error querying documents: {str(e)}"
-        ) 
\ No newline at end of file
+        ) 
+
+
+def _format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/query/stream")
+async def query_rag_stream(
+    query_request: QueryRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    To query documents using RAG and stream the answer as server-sent events.
+    Emits a `sources` event, then `token` events, then `done`.
+    """
+    if not authorize(current_user, "use", "rag"):
+        logger.error("User %s not authorized to use RAG", current_user.username)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to use RAG"
+        )
+    
+    partitions = _search_partitions(current_user, db, query_request.document_ids)
+    # the session is only closed after the response, so release its connection now
+    db.close()
+    
+    async def event_stream():
+        try:
+            async for item in stream_query_documents(
+                query=query_request.query,
+                top_k=query_request.top_k,
+                partitions=partitions,
+                retrieval=query_request.retrieval,
+                vector_weight=query_request.vector_weight,
+                bm25_weight=query_request.bm25_weight,
+                rerank=query_request.rerank,
+                rerank_candidates=query_request.rerank_candidates
+            ):
+                yield _format_sse(item["event"], item["data"])
+            logger.info(
+                "Streaming query of %s characters executed successfully by user %s",
+                len(query_request.query), current_user.username, extra=SAMPLED
+            )
+        except Exception as e:
+            logger.error("Error querying documents: %s", e)
+            yield _format_sse("error", f"Error querying documents: {str(e)}")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def query_rag_batch(
+    batch_request: BatchQueryRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    To answer a list of RAG queries in one call. Results are returned in request
+    order, each with either a result or an error.
+    """
+    if not authorize(current_user, "use", "rag"):
+        logger.error("User %s not authorized to use RAG", current_user.username)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to use RAG"
+        )
+    
+    partitions_by_selection: Dict[Any, Dict[str, Optional[Dict[str, Any]]]] = {}
+    requests = []
+    for query_request in batch_request.queries:
+        selection = tuple(sorted(query_request.document_ids)) if query_request.document_ids is not None else None
+        if selection not in partitions_by_selection:
+            partitions_by_selection[selection] = _search_partitions(current_user, db, query_request.document_ids)
+        requests.append({
+            "query": query_request.query,
+            "top_k": query_request.top_k,
+            "partitions": partitions_by_selection[selection],
+            "retrieval": query_request.retrieval,
+            "vector_weight": query_request.vector_weight,
+            "bm25_weight": query_request.bm25_weight,
+            "rerank": query_request.rerank,
+            "rerank_candidates": query_request.rerank_candidates
+        })
+    db.close()
+    
+    results = await query_documents_batch(requests)
+    failed = sum(1 for item in results if item["error"])
+    logger.info("Batch of %s queries (%s failed) executed by user %s", len(results), failed, current_user.username, extra=SAMPLED)
+    return {"results": results}
+
+
+@router.get("/cache/stats")
+async def answer_cache_stats(
+    current_user: User = Depends(require_permission("read", "metrics"))
+):
+    """
+    To get answer cache hit/miss counters. Requires admin role.
+    """
+    return answer_cache.stats()
+
+
+@router.get("/query-batching/stats")
+async def query_batching_stats(
+    current_user: User = Depends(require_permission("read", "metrics"))
+):
+    """
+    To get query embedding micro-batching histograms (queue wait, batch size). Requires admin role.
+    """
+    return query_batcher.stats()
+
+
+@router.get("/persistence/stats")
+async def persistence_stats(
+    current_user: User = Depends(require_permission("read", "metrics"))
+):
+    """
+    To get vector index persist scheduler counters. Requires admin role.
+    """
+    return persist_scheduler.stats()
+
+
+@router.get("/llm/stats")
+async def llm_stats(
+    current_user: User = Depends(require_permission("read", "metrics"))
+):
+    """
+    To get the LLM provider and its circuit breaker state. Requires admin role.
+    """
+    return llm_status()
+
+
+@router.get("/rerank/stats")
+async def rerank_stats(
+    current_user: User = Depends(require_permission("read", "metrics"))
+):
+    """
+    To get reranker score cache counters. Requires admin role.
+    """
+    return reranker_status()
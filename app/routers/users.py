@@ -3,13 +3,14 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 import logging
 from app.database import get_db
+from app.logging_config import SAMPLED
 from app.models.user import User
 from app.auth.jwt import get_current_active_user
 from app.auth.authorization import authorize, require_permission
-from app.auth.security import get_password_hash
+from app.auth.security import get_password_hash_async, PasswordHasherBusyError
+from app.auth.principal_cache import principal_cache
 from pydantic import BaseModel, EmailStr, Field
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/users", tags=["Users"])
@@ -53,20 +54,20 @@ async def read_user(
     user = db.query(User).filter(User.id == user_id).first()
     
     if not user:
-        logger.error(f"User {current_user.username} not found")
+        logger.error("User %s not found", current_user.username)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
     if not authorize(current_user, "read", user):
-        logger.error(f"User {current_user.username} not authorized to read user {user.username}")
+        logger.error("User %s not authorized to read user %s", current_user.username, user.username)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to read this user"
         )
     
-    logger.info(f"User {user.username} accessed successfully by user {current_user.username}")
+    logger.info("User %s accessed successfully by user %s", user.username, current_user.username, extra=SAMPLED)
     return user
 
 
@@ -83,14 +84,14 @@ async def update_user(
     user = db.query(User).filter(User.id == user_id).first()
     
     if not user:
-        logger.error(f"User {current_user.username} not found")
+        logger.error("User %s not found", current_user.username)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
     if not authorize(current_user, "update", user):
-        logger.error(f"User {current_user.username} not authorized to update user {user.username}")
+        logger.error("User %s not authorized to update user %s", current_user.username, user.username)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to update this user"
@@ -99,7 +100,7 @@ async def update_user(
     if user_update.username:
         existing_user = db.query(User).filter(User.username == user_update.username).first()
         if existing_user and existing_user.id != user_id:
-            logger.error(f"Username {user_update.username} already taken")
+            logger.error("Username %s already taken", user_update.username)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already taken"
@@ -109,7 +110,7 @@ async def update_user(
     if user_update.email:
         existing_user = db.query(User).filter(User.email == user_update.email).first()
         if existing_user and existing_user.id != user_id:
-            logger.error(f"Email {user_update.email} already taken")
+            logger.error("Email %s already taken", user_update.email)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already taken"
@@ -117,11 +118,20 @@ async def update_user(
         user.email = user_update.email
     
     if user_update.password:
-        user.hashed_password = get_password_hash(user_update.password)
+        try:
+            user.hashed_password = await get_password_hash_async(user_update.password)
+        except PasswordHasherBusyError:
+            logger.warning("Password hashing queue full, rejecting password update")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many password updates, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
     
     db.commit()
     db.refresh(user)
-    logger.info(f"User {user.username} updated successfully by user {current_user.username}")
+    principal_cache.invalidate_user(user.id)
+    logger.info("User %s updated successfully by user %s", user.username, current_user.username)
     
     return user
 
@@ -137,7 +147,7 @@ async def list_users(
     """
     db = next(get_db())
     users = db.query(User).offset(skip).limit(limit).all()
-    logger.info(f"Listed {len(users)} users successfully by user {current_user.username}")
+    logger.info("Listed %s users successfully by user %s", len(users), current_user.username, extra=SAMPLED)
     return users
 
 
@@ -154,7 +164,7 @@ async def update_user_role(
     user = db.query(User).filter(User.id == user_id).first()
     
     if not user:
-        logger.error(f"User {current_user.username} not found")
+        logger.error("User %s not found", current_user.username)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
@@ -164,5 +174,6 @@ async def update_user_role(
     
     db.commit()
     db.refresh(user)
-    logger.info(f"User {user.username} role updated successfully by user {current_user.username}")
+    principal_cache.invalidate_user(user.id)
+    logger.info("User %s role updated successfully by user %s", user.username, current_user.username)
     return user 
\ No newline at end of file
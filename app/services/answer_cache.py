@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Hashable, Tuple, List
+
+import numpy as np
+import logging
+
+from app.metrics import REGISTRY, cache_collector
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "600"))
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+
+CacheKey = Tuple[str, int, Hashable]
+
+
+def normalize_query(query: str) -> str:
+    """
+    This function normalizes query text for exact-match lookups.
+    """
+    return " ".join(query.lower().split())
+
+
+def _estimate_size(result: Dict[str, Any], embedding: np.ndarray) -> int:
+    size = embedding.nbytes + len(result.get("answer", ""))
+    for source in result.get("sources", []):
+        size += len(source.get("content", "")) + len(str(source.get("metadata", "")))
+    return size
+
+
+class _Entry:
+    __slots__ = ("result", "embedding", "expires_at", "size")
+
+    def __init__(self, result: Dict[str, Any], embedding: np.ndarray, expires_at: float, size: int):
+        self.result = result
+        self.embedding = embedding
+        self.expires_at = expires_at
+        self.size = size
+
+
+class AnswerCache:
+    """
+    Two-tier answer cache for RAG queries.
+
+    The exact tier is keyed on normalized query text, top_k and an access scope.
+    The semantic tier compares the query embedding against cached query embeddings
+    with the same top_k and scope and returns an answer above a cosine threshold.
+    Entries are evicted LRU-first once the entry or byte bound is exceeded, and
+    expire after a TTL. Every vector store write must call `invalidate()`; results
+    computed against an older version are never stored.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        max_bytes: int = ANSWER_CACHE_MAX_BYTES,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        enabled: bool = ANSWER_CACHE_ENABLED
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.enabled = enabled
+        self.version = 0
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._exact_hits = 0
+        self._semantic_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _remove(self, key: CacheKey):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _get_live(self, key: CacheKey, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_exact(self, query: str, top_k: int, scope: Hashable = None) -> Optional[Dict[str, Any]]:
+        """
+        This function looks up a cached answer by normalized query text.
+        A miss here is not counted; the semantic lookup that follows records it.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._get_live((normalize_query(query), top_k, scope), time.monotonic())
+            if entry is None:
+                return None
+            self._exact_hits += 1
+            return entry.result
+
+    def record_miss(self):
+        """
+        This function counts a miss for lookups that skip the semantic tier.
+        """
+        if self.enabled:
+            with self._lock:
+                self._misses += 1
+
+    def get_semantic(self, embedding: List[float], top_k: int, scope: Hashable = None) -> Optional[Dict[str, Any]]:
+        """
+        This function looks up a cached answer whose query embedding is close enough to this one.
+        """
+        if not self.enabled:
+            return None
+        vector = _normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for key, entry in list(self._entries.items()):
+                if key[1] != top_k or key[2] != scope or entry.embedding.size == 0:
+                    continue
+                if entry.expires_at <= now:
+                    self._remove(key)
+                    continue
+                score = float(np.dot(vector, entry.embedding))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._semantic_hits += 1
+            return self._entries[best_key].result
+
+    def put(
+        self,
+        query: str,
+        top_k: int,
+        embedding: Optional[List[float]],
+        result: Dict[str, Any],
+        version: int,
+        scope: Hashable = None
+    ):
+        """
+        This function stores an answer computed while the cache was at `version`.
+        Without an embedding the answer is only found by the exact tier.
+        """
+        if not self.enabled:
+            return
+        vector = _normalize(embedding) if embedding is not None else np.zeros(0, dtype=np.float32)
+        size = _estimate_size(result, vector)
+        if size > self.max_bytes:
+            return
+        key = (normalize_query(query), top_k, scope)
+        with self._lock:
+            if version != self.version:
+                # the index changed while this answer was being computed
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(result, vector, time.monotonic() + self.ttl_seconds, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate(self):
+        """
+        This function drops every cached answer and bumps the cache version.
+        """
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._invalidations += 1
+        logger.info("Answer cache invalidated (version %s)", self.version)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._exact_hits + self._semantic_hits
+            lookups = hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "version": self.version,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "exact_hits": self._exact_hits,
+                "semantic_hits": self._semantic_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+answer_cache = AnswerCache()
+
+
+def _metrics_stats() -> Dict[str, Any]:
+    stats = answer_cache.stats()
+    return {**stats, "hits": stats["exact_hits"] + stats["semantic_hits"]}
+
+
+REGISTRY.register_collector(cache_collector("answer", _metrics_stats))
@@ -0,0 +1,233 @@
+import importlib.util
+import math
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from langchain.schema import Document as ChunkDocument
+import logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Hugging Face tokenizer of the served model, used to count context tokens when set;
+# provider model ids (LLM_MODEL) are not hub repositories, so there is no default
+RAG_TOKENIZER_NAME = os.getenv("RAG_TOKENIZER_NAME")
+# the word-and-punctuation estimate undercounts subword tokens; it is scaled up by this much
+RAG_TOKEN_ESTIMATE_MARGIN = float(os.getenv("RAG_TOKEN_ESTIMATE_MARGIN", "1.3"))
+
+PASSAGE_SEPARATOR = "\n\n"
+# chunks sharing at least this fraction of their word trigrams are near-duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.9
+# overlaps shorter than this are not treated as splitter overlap
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 400
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SPACES_PATTERN = re.compile(r"[ \t\f\v]+")
+_BLANK_LINES_PATTERN = re.compile(r"\s*\n\s*\n\s*")
+_encode: Optional[Callable[[str], List[int]]] = None
+_encode_loaded = False
+_encode_lock = threading.Lock()
+
+
+def _load_encoder() -> Optional[Callable[[str], List[int]]]:
+    if RAG_TOKENIZER_NAME:
+        try:
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(RAG_TOKENIZER_NAME)
+            return lambda text: tokenizer.encode(text, add_special_tokens=False, verbose=False)
+        except Exception as e:
+            logger.warning("Could not load the %s tokenizer: %s", RAG_TOKENIZER_NAME, e)
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: encoding.encode(text, disallowed_special=())
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning("Could not load tiktoken's cl100k_base encoding: %s", e)
+    return None
+
+
+def token_counter_description() -> str:
+    """
+    This function names the token counter count_tokens is configured to use, without loading it.
+    """
+    if RAG_TOKENIZER_NAME:
+        return f"the {RAG_TOKENIZER_NAME} tokenizer"
+    if importlib.util.find_spec("tiktoken") is not None:
+        return "tiktoken's cl100k_base encoding"
+    return f"a word and punctuation estimate with a {RAG_TOKEN_ESTIMATE_MARGIN:.2f}x margin"
+
+
+def count_tokens(text: str) -> int:
+    """
+    This function counts tokens with the served model's tokenizer when RAG_TOKENIZER_NAME
+    names one (loaded through transformers), falling back to tiktoken's cl100k_base encoding and
+    then to words plus punctuation marks scaled by RAG_TOKEN_ESTIMATE_MARGIN, since
+    that estimate falls short of subword token counts.
+    """
+    global _encode, _encode_loaded
+    if not _encode_loaded:
+        with _encode_lock:
+            if not _encode_loaded:
+                _encode = _load_encoder()
+                _encode_loaded = True
+    if _encode is not None:
+        return len(_encode(text))
+    return math.ceil(len(_TOKEN_PATTERN.findall(text)) * RAG_TOKEN_ESTIMATE_MARGIN)
+
+
+def compact_whitespace(text: str) -> str:
+    """
+    This function collapses runs of spaces and blank lines, which PDF extraction leaves many of.
+    """
+    text = _BLANK_LINES_PATTERN.sub("\n\n", text)
+    return "\n".join(_SPACES_PATTERN.sub(" ", line).strip() for line in text.split("\n")).strip()
+
+
+def _trigrams(text: str) -> set:
+    words = text.lower().split()
+    return {tuple(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of `first` that is a prefix of `second`."""
+    if len(second) < MIN_OVERLAP_CHARS:
+        return 0
+    probe = second[:MIN_OVERLAP_CHARS]
+    position = first.find(probe, max(len(first) - MAX_OVERLAP_CHARS, 0))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(probe, position + 1)
+    return 0
+
+
+class _Passage:
+    __slots__ = ("text", "rank", "source", "trigrams")
+
+    def __init__(self, text: str, rank: int, source: Any):
+        self.text = text
+        self.rank = rank
+        self.source = source
+        self.trigrams = _trigrams(text)
+
+
+def _source_key(doc: ChunkDocument) -> Any:
+    metadata = doc.metadata or {}
+    return (metadata.get("document_id"), metadata.get("source"), metadata.get("page"))
+
+
+def _merge_overlapping(passages: List[_Passage]) -> int:
+    """
+    Joins chunks of the same source whose ends overlap (consecutive splitter chunks)
+    into one passage, kept at the better rank. Returns the characters removed.
+    """
+    removed = 0
+    merged = True
+    while merged:
+        merged = False
+        for i, first in enumerate(passages):
+            for j, second in enumerate(passages):
+                if i == j or first.source != second.source:
+                    continue
+                length = _overlap(first.text, second.text)
+                if not length:
+                    continue
+                first.text = first.text + second.text[length:]
+                first.rank = min(first.rank, second.rank)
+                first.trigrams = _trigrams(first.text)
+                removed += length
+                passages.pop(j)
+                merged = True
+                break
+            if merged:
+                break
+    return removed
+
+
+def _truncate_to_budget(text: str, budget: int, count: Callable[[str], int]) -> str:
+    """The longest prefix of `text`, cut at a word boundary, within `budget` tokens."""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text.rfind(" ", 0, low)
+    return text[:cut if cut > 0 else low].rstrip()
+
+
+def assemble_context(
+    docs: List[ChunkDocument],
+    token_budget: Optional[int] = None,
+    near_duplicate_threshold: float = NEAR_DUPLICATE_THRESHOLD,
+    count: Callable[[str], int] = count_tokens
+) -> Dict[str, Any]:
+    """
+    This function builds the LLM context from retrieved chunks, given best first.
+
+    Whitespace is compacted, near-duplicate chunks are dropped in favour of the
+    better ranked one, and overlapping consecutive chunks of the same source are
+    joined so the overlap appears once. Passages are then packed in relevance order
+    under `token_budget` tokens (no limit when None or 0): a passage that does not
+    fit is skipped in favour of smaller ones after it, and the first passage is
+    truncated if it alone exceeds the budget.
+
+    Returns the context and counters: tokens before and after, chunks used and the
+    duplicates, overlap characters and passages removed.
+    """
+    passages: List[_Passage] = []
+    duplicates = 0
+    source_tokens = 0
+    for rank, doc in enumerate(docs):
+        text = compact_whitespace(doc.page_content)
+        source_tokens += count(doc.page_content)
+        if not text:
+            continue
+        passage = _Passage(text, rank, _source_key(doc))
+        if any(
+            len(passage.trigrams & kept.trigrams) / max(min(len(passage.trigrams), len(kept.trigrams)), 1)
+            >= near_duplicate_threshold
+            for kept in passages
+        ):
+            duplicates += 1
+            continue
+        passages.append(passage)
+
+    overlap_chars = _merge_overlapping(passages)
+    passages.sort(key=lambda passage: passage.rank)
+
+    separator_tokens = count(PASSAGE_SEPARATOR)
+    selected, used, skipped, truncated = [], 0, 0, False
+    for passage in passages:
+        tokens = count(passage.text)
+        cost = tokens + (separator_tokens if selected else 0)
+        if token_budget and used + cost > token_budget:
+            if selected:
+                skipped += 1
+                continue
+            passage.text = _truncate_to_budget(passage.text, token_budget, count)
+            tokens = cost = count(passage.text)
+            truncated = True
+        selected.append(passage.text)
+        used += cost
+
+    return {
+        "context": PASSAGE_SEPARATOR.join(selected),
+        "tokens": used,
+        "source_tokens": source_tokens,
+        "passages": len(selected),
+        "duplicates_dropped": duplicates,
+        "overlap_chars_removed": overlap_chars,
+        "passages_skipped": skipped,
+        "truncated": truncated,
+    }
@@ -0,0 +1,135 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Iterator, List, Optional, Tuple
+
+from langchain.schema import Document as ChunkDocument
+import logging
+
+logger = logging.getLogger(__name__)
+
+# processes parsing PDF page ranges; 1 parses inline on the calling thread
+PDF_PARSE_PROCESSES = int(os.getenv("PDF_PARSE_PROCESSES", str(os.cpu_count() or 1)))
+# each task re-opens the PDF, so ranges should not be too small
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+# page-range tasks parsed ahead of the consumer; bounds memory for large PDFs
+PDF_PARSE_MAX_PENDING = int(os.getenv("PDF_PARSE_MAX_PENDING", str(2 * PDF_PARSE_PROCESSES)))
+# plain text files are read in blocks of this many characters, cut at paragraph breaks
+TEXT_BLOCK_SIZE = int(os.getenv("TEXT_BLOCK_SIZE", str(256 * 1024)))
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # spawn, not fork: the server process runs many threads
+            _parse_pool = ProcessPoolExecutor(max_workers=PDF_PARSE_PROCESSES, mp_context=get_context("spawn"))
+            logger.info("PDF parsing pool started with %s processes", PDF_PARSE_PROCESSES)
+        return _parse_pool
+
+
+def shutdown_parse_pool():
+    """
+    This function stops the PDF parsing processes, if they were started.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=True)
+            _parse_pool = None
+
+
+def count_pdf_pages(file_path: str) -> int:
+    import pypdf
+
+    return len(pypdf.PdfReader(file_path).pages)
+
+
+def parse_pdf_range(file_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """
+    This function extracts the text of pages [start, stop) of a PDF. It runs in the
+    parsing processes, so it only takes and returns plain picklable values.
+    """
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path)
+    return [(number, reader.pages[number].extract_text()) for number in range(start, stop)]
+
+
+def iter_pdf_pages(file_path: str, num_pages: Optional[int] = None) -> Iterator[ChunkDocument]:
+    """
+    This function yields a PDF's pages in order, one Document per page with the same
+    metadata as PyPDFLoader. Page ranges are parsed on the process pool at most
+    PDF_PARSE_MAX_PENDING tasks ahead of the consumer.
+    """
+    num_pages = count_pdf_pages(file_path) if num_pages is None else num_pages
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, num_pages)) for start in range(0, num_pages, PDF_PAGES_PER_TASK)]
+
+    if PDF_PARSE_PROCESSES <= 1 or len(ranges) <= 1:
+        import pypdf
+
+        # inline, one reader serves every page; pages are still produced one at a time
+        reader = pypdf.PdfReader(file_path)
+        for number in range(num_pages):
+            yield ChunkDocument(page_content=reader.pages[number].extract_text(), metadata={"source": file_path, "page": number})
+        return
+
+    pool = _get_parse_pool()
+    pending = deque()
+    next_range = 0
+    try:
+        while pending or next_range < len(ranges):
+            while next_range < len(ranges) and len(pending) < PDF_PARSE_MAX_PENDING:
+                pending.append(pool.submit(parse_pdf_range, file_path, *ranges[next_range]))
+                next_range += 1
+            for number, text in pending.popleft().result():
+                yield ChunkDocument(page_content=text, metadata={"source": file_path, "page": number})
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_text_pages(file_path: str) -> Iterator[ChunkDocument]:
+    """
+    This function yields a text file in blocks of about TEXT_BLOCK_SIZE characters,
+    each ending at a paragraph (or line) break where there is one, so the whole file
+    is never held in memory.
+    """
+    with open(file_path, encoding="utf-8") as f:
+        carry = ""
+        while True:
+            block = f.read(TEXT_BLOCK_SIZE)
+            if not block:
+                break
+            text = carry + block
+            if len(block) < TEXT_BLOCK_SIZE:
+                # last block
+                carry = ""
+                yield ChunkDocument(page_content=text, metadata={"source": file_path})
+                break
+            cut = text.rfind("\n\n")
+            if cut <= 0:
+                cut = text.rfind("\n")
+            if cut <= 0:
+                cut = len(text)
+            carry = text[cut:]
+            yield ChunkDocument(page_content=text[:cut], metadata={"source": file_path})
+        if carry.strip():
+            yield ChunkDocument(page_content=carry, metadata={"source": file_path})
+
+
+def iter_document_pages(file_path: str, file_type: str) -> Iterator[ChunkDocument]:
+    """
+    This function yields a stored document's pages lazily based on its file type.
+    """
+    if file_type.lower() == 'pdf':
+        return iter_pdf_pages(file_path)
+    elif file_type.lower() == 'txt':
+        return iter_text_pages(file_path)
+    else:
+        raise ValueError(f"Unsupported file type: {file_type}")
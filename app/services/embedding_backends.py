@@ -0,0 +1,190 @@
+import os
+import json
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+import logging
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model.int8.onnx"
+ONNX_CONFIG_FILE = "pooling.json"
+
+
+def create_embeddings(
+    backend: str,
+    model_name: str,
+    batch_size: int,
+    model_directory: str,
+    onnx_threads: int = 0
+) -> Embeddings:
+    """
+    This function builds the embeddings model for a backend:
+    "torch" (sentence-transformers), "onnx" (ONNX Runtime, fp32) or "onnx-int8"
+    (ONNX Runtime with dynamically int8-quantized weights). All three apply the
+    same pooling and normalization, so their vectors are interchangeable.
+    """
+    if backend == "torch":
+        from langchain.embeddings import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            encode_kwargs={"batch_size": batch_size}
+        )
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxSentenceEmbeddings(
+            model_name=model_name,
+            model_directory=model_directory,
+            quantized=backend == "onnx-int8",
+            batch_size=batch_size,
+            threads=onnx_threads
+        )
+    raise ValueError(f"Unsupported embedding backend: {backend}. Expected one of {', '.join(EMBEDDING_BACKENDS)}")
+
+
+def export_onnx_model(model_name: str, directory: str, quantize: bool = True):
+    """
+    This function exports a sentence-transformers model to ONNX (and optionally an
+    int8-quantized copy) together with its tokenizer and pooling configuration.
+    It needs torch and sentence-transformers; serving the exported model does not.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(directory, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = model[0], model[1]
+    if pooling.pooling_mode_mean_tokens:
+        pooling_mode = "mean"
+    elif pooling.pooling_mode_cls_token:
+        pooling_mode = "cls"
+    else:
+        raise ValueError(f"Unsupported pooling for ONNX export of {model_name}")
+    normalize = any(type(module).__name__ == "Normalize" for module in model)
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(*inputs)[0]
+
+    dummy = transformer.tokenizer(["warm up"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model_path = os.path.join(directory, ONNX_MODEL_FILE)
+    temp_path = f"{model_path}.{os.getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(transformer.auto_model.eval()),
+            tuple(dummy[name] for name in input_names),
+            temp_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    os.replace(temp_path, model_path)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        int8_path = os.path.join(directory, ONNX_INT8_MODEL_FILE)
+        temp_path = f"{int8_path}.{os.getpid()}.tmp"
+        quantize_dynamic(model_path, temp_path, weight_type=QuantType.QInt8)
+        os.replace(temp_path, int8_path)
+
+    transformer.tokenizer.save_pretrained(directory)
+    with open(os.path.join(directory, ONNX_CONFIG_FILE), "w") as f:
+        json.dump({
+            "pooling": pooling_mode,
+            "normalize": normalize,
+            "max_seq_length": transformer.max_seq_length,
+        }, f)
+    logger.info("Exported %s to ONNX in %s", model_name, directory)
+
+
+class OnnxSentenceEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed with ONNX Runtime on CPU.
+
+    The model is exported from sentence-transformers into `model_directory` the
+    first time it is needed; pooling and normalization match the torch model.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        model_directory: str,
+        quantized: bool = False,
+        batch_size: int = 32,
+        threads: int = 0
+    ):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.model_directory = model_directory
+        self.quantized = quantized
+        self.batch_size = batch_size
+
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        model_path = os.path.join(model_directory, model_file)
+        if not os.path.exists(model_path) or not os.path.exists(os.path.join(model_directory, ONNX_CONFIG_FILE)):
+            export_onnx_model(model_name, model_directory, quantize=quantized)
+
+        with open(os.path.join(model_directory, ONNX_CONFIG_FILE)) as f:
+            config = json.load(f)
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+        self.max_seq_length = config["max_seq_length"]
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self._session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self._session.get_inputs()}
+        self._tokenizer = AutoTokenizer.from_pretrained(model_directory)
+        # tokenizers are not safe to share across threads mid-call
+        self._tokenizer_lock = threading.Lock()
+        logger.info("ONNX embedding backend loaded from %s", model_path)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        with self._tokenizer_lock:
+            encoded = self._tokenizer(
+                texts,
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+        feeds = {name: encoded[name].astype(np.int64) for name in self._input_names if name in encoded}
+        hidden = self._session.run(None, feeds)[0]
+        if self.pooling == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.astype(np.float32)
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        batch_size = batch_size or self.batch_size
+        cleaned = [text.replace("\n", " ") for text in texts]
+        batches = [self._encode_batch(cleaned[i:i + batch_size]) for i in range(0, len(cleaned), batch_size)]
+        return np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
@@ -0,0 +1,246 @@
+import os
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+import logging
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f32"
+INDEX_FILE = "index.txt"
+
+
+def content_hash(text: str) -> str:
+    """
+    This function returns the hex sha256 of a chunk's text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """
+    Append-only, content-hash-keyed embedding store.
+
+    Vectors are appended as raw float32 rows to `vectors.f32` and read back
+    through a memory map; `index.txt` holds one hex hash per line, so the line
+    number is the row number. Vectors are always written before their index
+    lines, so a crash can only leave unindexed rows behind, never a dangling
+    index entry. Appends take an exclusive file lock, which keeps several
+    worker processes sharing one directory consistent.
+    """
+
+    def __init__(self, directory: str, dimension: int):
+        self.directory = directory
+        self.dimension = dimension
+        self._vectors_path = os.path.join(directory, VECTORS_FILE)
+        self._index_path = os.path.join(directory, INDEX_FILE)
+        self._rows: Dict[str, int] = {}
+        self._row_count = 0
+        self._index_offset = 0
+        self._memmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        for path in (self._vectors_path, self._index_path):
+            if not os.path.exists(path):
+                open(path, "ab").close()
+        self._sync()
+
+    def __len__(self) -> int:
+        return self._row_count
+
+    def _row_bytes(self) -> int:
+        return self.dimension * 4
+
+    def _sync(self):
+        """
+        Picks up index lines appended since the last read, possibly by another process.
+        """
+        if os.path.getsize(self._index_path) == self._index_offset:
+            return
+        complete_rows = os.path.getsize(self._vectors_path) // self._row_bytes()
+        with open(self._index_path, "rb") as index_file:
+            index_file.seek(self._index_offset)
+            for line in index_file:
+                if not line.endswith(b"\n") or self._row_count >= complete_rows:
+                    break
+                self._rows.setdefault(line.strip().decode("ascii"), self._row_count)
+                self._row_count += 1
+                self._index_offset += len(line)
+        self._memmap = None
+
+    def _matrix(self) -> np.memmap:
+        if self._memmap is None or self._memmap.shape[0] < self._row_count:
+            self._memmap = np.memmap(
+                self._vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self._row_count, self.dimension)
+            )
+        return self._memmap
+
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        with self._lock:
+            if any(h not in self._rows for h in hashes):
+                self._sync()
+            found = {h: self._rows[h] for h in hashes if h in self._rows}
+            if not found:
+                return {}
+            matrix = self._matrix()
+            return {h: np.array(matrix[row]) for h, row in found.items()}
+
+    def add_many(self, hashes: List[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, open(self._index_path, "ab") as index_file:
+            if fcntl is not None:
+                fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                self._sync()
+                new_rows = [i for i, h in enumerate(hashes) if h not in self._rows]
+                if not new_rows:
+                    return
+                # truncate rows a crashed writer may have left unindexed
+                with open(self._vectors_path, "r+b") as vectors_file:
+                    vectors_file.truncate(self._row_count * self._row_bytes())
+                    vectors_file.seek(0, os.SEEK_END)
+                    vectors_file.write(vectors[new_rows].tobytes())
+                    vectors_file.flush()
+                    os.fsync(vectors_file.fileno())
+                lines = "".join(f"{hashes[i]}\n" for i in new_rows).encode("ascii")
+                index_file.write(lines)
+                index_file.flush()
+                for i in new_rows:
+                    self._rows[hashes[i]] = self._row_count
+                    self._row_count += 1
+                self._index_offset += len(lines)
+                self._memmap = None
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(index_file, fcntl.LOCK_UN)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model with a persistent content-hash-keyed cache.
+
+    `embed_documents` only encodes texts whose hash is not in the store yet, in
+    batches of `batch_size`. When `processes` is set and a call has at least
+    `multi_process_min_texts` misses, encoding is spread over a
+    sentence-transformers multi-process pool. Queries are not cached here.
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        directory: str,
+        batch_size: int = 32,
+        processes: int = 0,
+        multi_process_min_texts: int = 512
+    ):
+        self.base = base
+        self.directory = directory
+        self.batch_size = batch_size
+        self.processes = processes
+        self.multi_process_min_texts = multi_process_min_texts
+        self._store: Optional[DiskEmbeddingStore] = None
+        self._store_lock = threading.Lock()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._open_existing_store()
+
+    def _open_existing_store(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith("dim") and name[3:].isdigit():
+                self._get_store(int(name[3:]))
+                return
+
+    def _get_store(self, dimension: int) -> DiskEmbeddingStore:
+        with self._store_lock:
+            if self._store is None or self._store.dimension != dimension:
+                self._store = DiskEmbeddingStore(os.path.join(self.directory, f"dim{dimension}"), dimension)
+                logger.info("Embedding cache opened with %s vectors", len(self._store))
+            return self._store
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self.base.client.start_multi_process_pool(
+                    target_devices=["cpu"] * self.processes
+                )
+                logger.info("Embedding multi-process pool started with %s processes", self.processes)
+            return self._pool
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        use_pool = (
+            self.processes > 0
+            and len(texts) >= self.multi_process_min_texts
+            and hasattr(self.base, "client")
+        )
+        if use_pool:
+            cleaned = [text.replace("\n", " ") for text in texts]
+            return np.asarray(
+                self.base.client.encode_multi_process(cleaned, self._get_pool(), batch_size=self.batch_size),
+                dtype=np.float32
+            )
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self.base.embed_documents(texts[start:start + self.batch_size]))
+        return np.asarray(vectors, dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        hashes = [content_hash(text) for text in texts]
+        cached: Dict[str, np.ndarray] = {}
+        if self._store is not None:
+            cached = self._store.get_many(hashes)
+
+        missing: Dict[str, str] = {}
+        for h, text in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        self.hits += len(texts) - sum(1 for h in hashes if h in missing)
+        self.misses += len(missing)
+
+        if missing:
+            missing_hashes = list(missing)
+            vectors = self._encode([missing[h] for h in missing_hashes])
+            self._get_store(vectors.shape[1]).add_many(missing_hashes, vectors)
+            cached.update(zip(missing_hashes, vectors))
+
+        return [cached[h].tolist() for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries in one encode call, bypassing the document cache.
+        """
+        return self.base.embed_documents(texts)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored_vectors": len(self._store) if self._store is not None else 0,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self.base.client.stop_multi_process_pool(self._pool)
+                self._pool = None
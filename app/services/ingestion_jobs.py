@@ -0,0 +1,262 @@
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+from app.database import SessionLocal
+from app.models.document import Document, INGESTING
+from app.services.rag_service import (
+    process_document,
+    persist_scheduler,
+    delete_document_index,
+    legacy_chunk_hashes,
+    CHROMA_PERSIST_DIRECTORY,
+)
+from app.services.vector_index import LEGACY_PARTITION, PartitionedIndex, legacy_backfill_pending
+from app.services.jobs_model import IngestionJob
+
+logger = logging.getLogger(__name__)
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_MAX_TRACKED_JOBS = int(os.getenv("INGESTION_MAX_TRACKED_JOBS", "1000"))
+
+FINISHED_STATUSES = ("completed", "failed")
+
+_jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=INGESTION_WORKERS,
+                thread_name_prefix="ingestion"
+            )
+            logger.info("Ingestion worker pool started with %s workers", INGESTION_WORKERS)
+        return _executor
+
+
+def _track(job: IngestionJob):
+    with _jobs_lock:
+        _jobs[job.id] = job
+        # only finished jobs are evicted, oldest first
+        while len(_jobs) > INGESTION_MAX_TRACKED_JOBS:
+            evictable = next(
+                (job_id for job_id, tracked in _jobs.items() if tracked.status in FINISHED_STATUSES),
+                None
+            )
+            if evictable is None:
+                break
+            del _jobs[evictable]
+
+
+def _run_job(job: IngestionJob, file_path: str, collection_name: str, description: Optional[str]):
+    """
+    This function runs on an ingestion worker: processes the stored document and records it.
+    """
+    job.update(status="running")
+    db = SessionLocal()
+    db_document = None
+    try:
+        # the row is created first so its id can be stored on every chunk
+        db_document = Document(
+            title=job.title,
+            description=description,
+            file_path=file_path,
+            file_type=file_path.split('.')[-1].lower(),
+            uploader_id=job.uploader_id,
+            collection_name=collection_name,
+            status=INGESTING
+        )
+        db.add(db_document)
+        db.commit()
+        db.refresh(db_document)
+        job.update(document_id=db_document.id)
+
+        process_document(
+            file_path=file_path,
+            title=job.title,
+            description=description,
+            progress=job.update,
+            metadata={"document_id": db_document.id, "uploader_id": job.uploader_id},
+            collection_name=db_document.collection_name
+        )
+        # only completed documents are matched by later uploads of the same content
+        db_document.content_hash = job.content_hash
+        db_document.status = "completed"
+        db.commit()
+        job.update(status="completed", stage="completed")
+        logger.info("Ingestion job %s completed as document %s", job.id, db_document.id)
+    except Exception as e:
+        db.rollback()
+        if db_document is not None and db_document.id is not None:
+            # drop the chunks written before the failure, before the id can be reused
+            try:
+                delete_document_index(db_document.collection_name, db_document.id)
+            except Exception as cleanup_error:
+                logger.error("Could not remove the chunks of failed job %s: %s", job.id, cleanup_error)
+            db.delete(db_document)
+            db.commit()
+        if os.path.exists(file_path):
+            os.unlink(file_path)
+        job.update(status="failed", error=str(e), document_id=None)
+        logger.error("Ingestion job %s failed: %s", job.id, e)
+    finally:
+        job.update(finished_at=datetime.utcnow())
+        db.close()
+
+
+def submit_ingestion_job(
+    file_path: str,
+    collection_name: str,
+    filename: str,
+    title: str,
+    uploader_id: int,
+    description: Optional[str] = None,
+    content_hash: Optional[str] = None
+) -> IngestionJob:
+    """
+    This function queues an already stored document for background ingestion into
+    the `collection_name` partition and returns its job.
+    """
+    job = IngestionJob(
+        filename=filename,
+        title=title,
+        uploader_id=uploader_id,
+        content_hash=content_hash,
+        is_durable=persist_scheduler.is_durable
+    )
+    _track(job)
+    # the job's log records keep the request id of the upload that queued it
+    _get_executor().submit(contextvars.copy_context().run, _run_job, job, file_path, collection_name, description)
+    logger.info("Ingestion job %s queued for %s", job.id, filename)
+    return job
+
+
+def find_duplicate_document(db, content_hash: str) -> Optional[Document]:
+    """
+    This function returns a completed, partitioned document with the given content hash.
+    """
+    return db.query(Document).filter(
+        Document.content_hash == content_hash,
+        Document.collection_name.isnot(None)
+    ).order_by(Document.id).first()
+
+
+def record_duplicate_upload(
+    db,
+    original: Document,
+    filename: str,
+    title: str,
+    uploader_id: int,
+    description: Optional[str] = None
+) -> IngestionJob:
+    """
+    This function records a repeat upload of an already indexed document: a new
+    Document row sharing the original's chunks and stored file, with no parsing
+    or embedding. The returned job is already completed.
+    """
+    db_document = Document(
+        title=title,
+        description=description,
+        file_path=original.file_path,
+        file_type=original.file_type,
+        uploader_id=uploader_id,
+        collection_name=original.collection_name,
+        content_hash=original.content_hash,
+        source_document_id=original.source_document_id or original.id
+    )
+    db.add(db_document)
+    db.commit()
+    db.refresh(db_document)
+
+    job = IngestionJob(filename=filename, title=title, uploader_id=uploader_id, content_hash=original.content_hash)
+    job.update(
+        status="completed",
+        stage="completed",
+        deduplicated=True,
+        document_id=db_document.id,
+        finished_at=datetime.utcnow()
+    )
+    _track(job)
+    logger.info("Upload of %s deduplicated against document %s as document %s", filename, original.id, db_document.id)
+    return job
+
+
+def backfill_legacy_documents() -> Optional[int]:
+    """
+    This function stamps document_id and uploader_id on the chunks of documents
+    indexed into the legacy collection before chunks carried them. Their `source` is
+    a long gone temporary file, so each stored document is re-split and its chunks
+    are matched on content. Until then the owners' filtered searches and deletes do
+    not find those chunks. The collection is marked done only once every legacy
+    document has been matched; later runs retry the rest. Nothing is loaded when the
+    collection is already marked or there are no legacy documents.
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(Document.id, Document.file_path, Document.file_type, Document.uploader_id).filter(
+            Document.collection_name.is_(None)
+        ).all()
+    finally:
+        db.close()
+    if not rows or not legacy_backfill_pending(CHROMA_PERSIST_DIRECTORY):
+        return None
+
+    # writes only metadata, so no embedding model is needed
+    index = PartitionedIndex(CHROMA_PERSIST_DIRECTORY, embedding_function=None)
+    matched = index.documents_with_chunks(LEGACY_PARTITION)
+    owners: Dict[str, List[Dict[str, Any]]] = {}
+    for document_id, file_path, file_type, uploader_id in rows:
+        if document_id in matched:
+            continue
+        try:
+            hashes = legacy_chunk_hashes(file_path, file_type)
+        except Exception as e:
+            logger.warning("Could not re-split legacy document %s (%s): %s", document_id, file_path, e)
+            continue
+        if not hashes:
+            # nothing was indexed for it
+            matched.add(document_id)
+        for chunk_hash in hashes:
+            owners.setdefault(chunk_hash, []).append({"document_id": document_id, "uploader_id": uploader_id})
+
+    updated, stamped = index.backfill_metadata(LEGACY_PARTITION, owners)
+    matched |= stamped
+    unmatched = [document_id for document_id, *_ in rows if document_id not in matched]
+    if unmatched:
+        logger.warning(
+            "Stamped %s legacy chunks; %s legacy documents are still unmatched and are retried on the next start: %s",
+            updated, len(unmatched), unmatched[:20]
+        )
+    else:
+        index.mark_backfilled(LEGACY_PARTITION)
+        logger.info("Stamped %s legacy chunks; all %s legacy documents matched", updated, len(rows))
+    return updated
+
+
+def get_ingestion_job(job_id: str) -> Optional[IngestionJob]:
+    """
+    This function returns a tracked ingestion job by id, if known to this process.
+    """
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def shutdown_ingestion_workers(wait: bool = True):
+    """
+    This function stops the worker pool, letting queued jobs finish when `wait` is set.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
@@ -0,0 +1,73 @@
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+
+class IngestionJob:
+    """
+    Tracks the state and progress of one background document ingestion.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        title: str,
+        uploader_id: int,
+        content_hash: Optional[str] = None,
+        is_durable: Optional[Callable[[Optional[int]], bool]] = None
+    ):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.title = title
+        self.uploader_id = uploader_id
+        self.content_hash = content_hash
+        self.deduplicated = False
+        self.status = "queued"
+        self.stage = "queued"
+        self.pages_parsed = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.persist_ticket: Optional[int] = None
+        self.document_id: Optional[int] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        # tells whether a persist ticket has been flushed; without one a ticket is durable when issued
+        self._is_durable = is_durable or (lambda ticket: ticket is not None)
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    @property
+    def durable(self) -> bool:
+        """
+        Whether the job's chunks have been persisted by the vector index.
+        """
+        if self.deduplicated:
+            return True
+        return self._is_durable(self.persist_ticket)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "filename": self.filename,
+                "title": self.title,
+                "uploader_id": self.uploader_id,
+                "content_hash": self.content_hash,
+                "deduplicated": self.deduplicated,
+                "pages_parsed": self.pages_parsed,
+                "chunks_total": self.chunks_total,
+                "chunks_embedded": self.chunks_embedded,
+                "durable": self.durable,
+                "document_id": self.document_id,
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
@@ -0,0 +1,390 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDERS = ("groq", "openai", "stub", "none")
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+GROQ_DEFAULT_MODEL = "llama3-8b-8192"
+# HTTP statuses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class LLMProviderError(Exception):
+    """Raised when the LLM provider fails to generate an answer."""
+
+
+class LLMRequestError(LLMProviderError):
+    """Raised when the provider rejects the request itself, e.g. a prompt too long for the model."""
+
+
+class LLMUnavailableError(LLMProviderError):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing provider.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls are
+    rejected right away for `reset_seconds`. Then one trial call is let through
+    (half-open): its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+            self._rejected += 1
+        raise LLMUnavailableError("LLM provider unavailable: circuit breaker is open")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                logger.warning("LLM circuit breaker opened after %s consecutive failures", self._failures)
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release(self):
+        """Ends a call that neither succeeded nor failed, e.g. one the client cancelled."""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._state(),
+                "consecutive_failures": self._failures,
+                "rejected_calls": self._rejected,
+            }
+
+
+class LLMProvider(ABC):
+    """
+    Generates answers from a prompt, whole or streamed.
+
+    Subclasses implement `_generate` and `_stream`; every call goes through the
+    provider's circuit breaker. Failures surface as LLMProviderError; rejected
+    requests (LLMRequestError) do not count towards opening the circuit.
+    """
+
+    name = "base"
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None):
+        self.breaker = breaker or CircuitBreaker()
+
+    async def generate(self, prompt: str) -> str:
+        self.breaker.before_call()
+        try:
+            answer = await self._generate(prompt)
+        except (asyncio.CancelledError, LLMRequestError):
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            if isinstance(e, LLMProviderError):
+                raise
+            raise LLMProviderError(f"{self.name} generation failed: {e}") from e
+        self.breaker.record_success()
+        return answer
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        self.breaker.before_call()
+        try:
+            async for token in self._stream(prompt):
+                yield token
+        except (asyncio.CancelledError, GeneratorExit, LLMRequestError):
+            # the client went away or sent a bad request; says nothing about the provider's health
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            if isinstance(e, LLMProviderError):
+                raise
+            raise LLMProviderError(f"{self.name} generation failed: {e}") from e
+        self.breaker.record_success()
+
+    @abstractmethod
+    async def _generate(self, prompt: str) -> str:
+        """Returns the whole answer to the prompt."""
+
+    @abstractmethod
+    def _stream(self, prompt: str) -> AsyncIterator[str]:
+        """Yields the answer to the prompt as it is generated (implemented as an async generator)."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"provider": self.name, "circuit_breaker": self.breaker.stats()}
+
+    async def aclose(self):
+        pass
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    Calls an OpenAI-compatible /chat/completions endpoint: a local server (vLLM,
+    llama.cpp, Ollama, ...) or Groq's OpenAI-compatible API.
+
+    Requests share one pooled httpx.AsyncClient, so connections are kept alive
+    across calls; the client's timeouts bound connecting and the wait for each
+    streamed chunk, and `timeout_seconds` also bounds a whole non-streamed call. Connection errors, 429 and 5xx responses are retried
+    up to `max_retries` times with exponential backoff, but a stream is never
+    retried once it started producing tokens.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        base_url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        temperature: float = 0.1,
+        max_tokens: int = 1024,
+        timeout_seconds: float = 30.0,
+        max_retries: int = 2,
+        retry_backoff_seconds: float = 0.5,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        super().__init__(breaker)
+        self.client = client
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model = model
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+
+    def _payload(self, prompt: str, stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": stream,
+        }
+
+    async def _send(self, prompt: str, stream: bool) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                request = self.client.build_request(
+                    "POST",
+                    self.url,
+                    json=self._payload(prompt, stream),
+                    headers=self.headers
+                )
+                response = await self.client.send(request, stream=stream)
+                if response.status_code < 400:
+                    return response
+                body = (await response.aread())[:200].decode("utf-8", "replace")
+                await response.aclose()
+                retryable = response.status_code in RETRYABLE_STATUSES
+                error_class = LLMProviderError if retryable or response.status_code >= 500 else LLMRequestError
+                error = error_class(f"{self.name} returned HTTP {response.status_code}: {body}")
+            except httpx.TransportError as e:
+                error = LLMProviderError(f"{self.name} request failed: {type(e).__name__}: {e}")
+                retryable = True
+            if not retryable or attempt >= self.max_retries:
+                raise error
+            delay = self.retry_backoff_seconds * 2 ** attempt
+            logger.warning("%s; retrying in %.1fs", error, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _generate(self, prompt: str) -> str:
+        async def call() -> str:
+            response = await self._send(prompt, stream=False)
+            return response.json()["choices"][0]["message"]["content"]
+
+        try:
+            return await asyncio.wait_for(call(), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            raise LLMProviderError(f"{self.name} generation timed out after {self.timeout_seconds}s")
+
+    async def _stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self._send(prompt, stream=True)
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
+        except httpx.TimeoutException:
+            raise LLMProviderError(f"{self.name} stream stalled for more than {self.timeout_seconds}s")
+        finally:
+            await response.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class GroqProvider(OpenAICompatibleProvider):
+    """Groq's hosted models, through its OpenAI-compatible API."""
+
+    name = "groq"
+
+
+class StubProvider(LLMProvider):
+    """
+    A deterministic local LLM for load tests and benchmarks.
+
+    It answers with the first `answer_tokens` words of the prompt's context after
+    `first_token_latency_ms`, producing `tokens_per_second` tokens per second, so
+    a generation costs latency + answer_tokens / tokens_per_second. A
+    `failure_rate` share of calls fails, drawn from a seeded generator.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        first_token_latency_ms: float = 200.0,
+        tokens_per_second: float = 50.0,
+        answer_tokens: int = 64,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        super().__init__(breaker)
+        self.first_token_latency = first_token_latency_ms / 1000
+        self.token_interval = 1 / tokens_per_second if tokens_per_second > 0 else 0.0
+        self.answer_tokens = answer_tokens
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def _tokens(self, prompt: str) -> List[str]:
+        context = prompt.split("Context:", 1)[-1].split("Question:", 1)[0]
+        words = context.split() or ["I", "don't", "know."]
+        return [word + " " for word in (words * self.answer_tokens)[:self.answer_tokens]]
+
+    def _check_failure(self):
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise LLMProviderError("stub provider failure")
+
+    async def _generate(self, prompt: str) -> str:
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self.first_token_latency + self.token_interval * (len(tokens) - 1))
+        self._check_failure()
+        return "".join(tokens).strip()
+
+    async def _stream(self, prompt: str) -> AsyncIterator[str]:
+        await asyncio.sleep(self.first_token_latency)
+        self._check_failure()
+        for index, token in enumerate(self._tokens(prompt)):
+            if index:
+                await asyncio.sleep(self.token_interval)
+            yield token
+
+
+def create_http_client(
+    max_connections: int,
+    connect_timeout_seconds: float = 5.0,
+    timeout_seconds: float = 30.0
+) -> httpx.AsyncClient:
+    """
+    This function builds the pooled async HTTP client shared by the HTTP providers.
+    Idle connections are kept alive, up to `max_connections` in total.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60
+        ),
+        timeout=httpx.Timeout(timeout_seconds, connect=connect_timeout_seconds)
+    )
+
+
+def create_llm_provider(
+    provider: str,
+    model: Optional[str] = None,
+    base_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+    temperature: float = 0.1,
+    max_tokens: int = 1024,
+    timeout_seconds: float = 30.0,
+    connect_timeout_seconds: float = 5.0,
+    max_connections: int = 32,
+    max_retries: int = 2,
+    circuit_failure_threshold: int = 5,
+    circuit_reset_seconds: float = 30.0,
+    stub_options: Optional[Dict[str, Any]] = None
+) -> Optional[LLMProvider]:
+    """
+    This function builds the LLM provider: "groq" (Groq API), "openai" (an
+    OpenAI-compatible server at `base_url`), "stub" (the deterministic local stub,
+    configured by `stub_options`) or "none", for which no provider is returned and
+    answers are extractive.
+    """
+    breaker = CircuitBreaker(circuit_failure_threshold, circuit_reset_seconds)
+    if provider == "none":
+        return None
+    if provider == "stub":
+        return StubProvider(breaker=breaker, **(stub_options or {}))
+    if provider in ("groq", "openai"):
+        if provider == "groq" and not api_key:
+            raise ValueError("LLM_PROVIDER=groq requires GROQ_API_KEY")
+        if provider == "openai" and not base_url:
+            raise ValueError("LLM_PROVIDER=openai requires LLM_BASE_URL")
+        provider_class = GroqProvider if provider == "groq" else OpenAICompatibleProvider
+        return provider_class(
+            client=create_http_client(max_connections, connect_timeout_seconds, timeout_seconds),
+            base_url=base_url or GROQ_BASE_URL,
+            model=model or (GROQ_DEFAULT_MODEL if provider == "groq" else "default"),
+            api_key=api_key,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout_seconds=timeout_seconds,
+            max_retries=max_retries,
+            breaker=breaker
+        )
+    raise ValueError(f"Unsupported LLM provider: {provider}. Expected one of {', '.join(LLM_PROVIDERS)}")
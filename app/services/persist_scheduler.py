@@ -0,0 +1,151 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PersistScheduler:
+    """
+    Coalesces vector index persists.
+
+    Writers mark the partitions they changed as dirty and get a ticket back. A
+    background thread flushes all dirty partitions at once when `max_pending`
+    documents are waiting or `max_delay_seconds` after the oldest one, whichever
+    comes first. A ticket is durable once a flush covering it has completed.
+
+    When the index writes through (`enabled=False`) there is nothing to flush and
+    every ticket is durable as soon as it is handed out.
+    """
+
+    def __init__(
+        self,
+        flush_partitions: Callable[[List[str]], None],
+        max_pending: int = 50,
+        max_delay_seconds: float = 5.0,
+        enabled: bool = True
+    ):
+        self.flush_partitions = flush_partitions
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self.max_delay_seconds = max_delay_seconds
+        self._dirty: Dict[str, None] = {}
+        self._pending = 0
+        self._oldest: Optional[float] = None
+        self._last_ticket = 0
+        self._durable_ticket = 0
+        self._flushes = 0
+        self._flush_errors = 0
+        self._condition = threading.Condition()
+        # serializes flushes so a ticket only counts as durable after its own flush
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="index-persist", daemon=True)
+            self._thread.start()
+
+    def mark_dirty(self, partition: str) -> int:
+        """
+        This function records a written document's partition and returns its ticket.
+        """
+        with self._condition:
+            self._last_ticket += 1
+            if not self.enabled:
+                self._durable_ticket = self._last_ticket
+                return self._last_ticket
+            self._dirty[partition] = None
+            self._pending += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._closed:
+                ticket = self._last_ticket
+            else:
+                self._ensure_thread()
+                self._condition.notify()
+                return self._last_ticket
+        # after close() there is no background thread, so flush right away
+        self.flush()
+        return ticket
+
+    def is_durable(self, ticket: Optional[int]) -> bool:
+        with self._condition:
+            return ticket is not None and ticket <= self._durable_ticket
+
+    def flush(self):
+        """
+        This function persists every dirty partition now, on the calling thread.
+        """
+        with self._flush_lock:
+            with self._condition:
+                partitions = list(self._dirty)
+                ticket = self._last_ticket
+                self._dirty.clear()
+                self._pending = 0
+                self._oldest = None
+            if not partitions:
+                return
+            started = time.perf_counter()
+            try:
+                self.flush_partitions(partitions)
+            except Exception as e:
+                with self._condition:
+                    # retried on the next flush
+                    for partition in partitions:
+                        self._dirty[partition] = None
+                    if self._oldest is None:
+                        self._oldest = time.monotonic()
+                    self._flush_errors += 1
+                logger.error("Error persisting %s index partitions: %s", len(partitions), e)
+                return
+            with self._condition:
+                self._durable_ticket = max(self._durable_ticket, ticket)
+                self._flushes += 1
+            logger.info("Persisted %s index partitions in %.3fs", len(partitions), time.perf_counter() - started)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._pending >= self.max_pending:
+                        break
+                    if self._oldest is not None:
+                        remaining = self._oldest + self.max_delay_seconds - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+            self.flush()
+
+    def close(self):
+        """
+        This function stops the background thread and flushes whatever is still dirty.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "enabled": self.enabled,
+                "max_pending": self.max_pending,
+                "max_delay_seconds": self.max_delay_seconds,
+                "pending_documents": self._pending,
+                "dirty_partitions": len(self._dirty),
+                "last_ticket": self._last_ticket,
+                "durable_ticket": self._durable_ticket,
+                "flushes": self._flushes,
+                "flush_errors": self._flush_errors,
+            }
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import logging
+
+from app.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+QUEUE_WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesces concurrent query embeddings into batched encode calls.
+
+    The first query to arrive opens a window of `max_wait_ms`; queries arriving
+    within it (up to `max_batch_size`) are encoded together by `embed_batch` on
+    `executor`, and each caller gets its own vector back. At most
+    `max_concurrent_batches` batches are encoded at once.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        executor,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+        max_concurrent_batches: int = 4
+    ):
+        self.embed_batch = embed_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_concurrent_batches = max_concurrent_batches
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_MS_BUCKETS)
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._batch_slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._batch_slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = loop.create_task(self._collect())
+
+    async def embed(self, text: str) -> List[float]:
+        """
+        This function embeds one query, sharing an encode call with concurrent queries.
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                remaining = deadline - time.perf_counter()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+                await asyncio.sleep(min(remaining, self.max_wait_ms / 4000))
+            await self._batch_slots.acquire()
+            self._loop.create_task(self._encode(batch))
+
+    async def _encode(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        try:
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+            self.batch_size.observe(len(batch))
+            texts = [text for text, _, _ in batch]
+            vectors = await self._loop.run_in_executor(self.executor, self.embed_batch, texts)
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            logger.error("Error embedding query batch: %s", e)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._batch_slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+        }
@@ -1,36 +1,168 @@
 import os
-import tempfile
-import uuid
-from typing import Dict, Any, Optional
+import json
+import asyncio
+import contextvars
+import functools
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable, AsyncIterator, Iterator, List
 
-from langchain.document_loaders import TextLoader, PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
+from langchain.schema import Document as ChunkDocument
 from dotenv import load_dotenv
 import logging
 
+from app.metrics import REGISTRY, cache_collector
+from app.services.answer_cache import answer_cache
+from app.services.embedding_cache import CachedEmbeddings, content_hash
+from app.services.embedding_backends import create_embeddings
+from app.services.document_pages import iter_document_pages, shutdown_parse_pool
+from app.services.query_batcher import QueryEmbeddingBatcher
+from app.services.persist_scheduler import PersistScheduler
+from app.services.vector_index import PartitionedIndex, LEGACY_PARTITION, is_document_partition, persist_required
+from app.services.sparse_index import SparseIndex, reciprocal_rank_fusion
+from app.services.context_builder import assemble_context, count_tokens
+from app.services.llm_providers import LLMProvider, LLMProviderError, create_llm_provider
+from app.services.reranker import Reranker, create_reranker
+
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-EMBEDDINGS = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2"
-)
-
 DOCUMENT_STORE_PATH = os.environ.get("DOCUMENT_STORE_PATH", "document_store")
 CHROMA_PERSIST_DIRECTORY = os.path.join(DOCUMENT_STORE_PATH, "chroma_db")
+SPARSE_INDEX_PATH = os.path.join(DOCUMENT_STORE_PATH, "sparse_index.db")
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# "torch" (sentence-transformers), "onnx" or "onnx-int8" (ONNX Runtime)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_DIRECTORY = os.getenv(
+    "EMBEDDING_ONNX_DIRECTORY",
+    os.path.join(DOCUMENT_STORE_PATH, "onnx_models", EMBEDDING_MODEL_NAME.replace("/", "__"))
+)
+# 0 lets ONNX Runtime pick the number of intra-op threads
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+# cached vectors are kept per backend, since each produces slightly different values
+EMBEDDING_CACHE_DIRECTORY = os.getenv(
+    "EMBEDDING_CACHE_DIRECTORY",
+    os.path.join(
+        DOCUMENT_STORE_PATH,
+        "embedding_cache",
+        EMBEDDING_MODEL_NAME.replace("/", "__") + ("" if EMBEDDING_BACKEND == "torch" else f"__{EMBEDDING_BACKEND}")
+    )
+)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# 0 disables multi-process encoding; otherwise the number of encoder processes
+EMBEDDING_PROCESSES = int(os.getenv("EMBEDDING_PROCESSES", "0"))
+EMBEDDING_MULTI_PROCESS_MIN_TEXTS = int(os.getenv("EMBEDDING_MULTI_PROCESS_MIN_TEXTS", "512"))
+INGESTION_BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", "64"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))
+# room for the multipart framing and form fields sent along with the file
+MAX_UPLOAD_BODY_OVERHEAD = int(os.getenv("MAX_UPLOAD_BODY_OVERHEAD", str(64 * 1024)))
 
-os.makedirs(DOCUMENT_STORE_PATH, exist_ok=True)
-os.makedirs(CHROMA_PERSIST_DIRECTORY, exist_ok=True)
+# query path concurrency: embedding and search run on a bounded executor,
+# each stage additionally capped so one stage cannot starve the others
+RAG_QUERY_WORKERS = int(os.getenv("RAG_QUERY_WORKERS", "4"))
+RAG_MAX_CONCURRENT_EMBEDS = int(os.getenv("RAG_MAX_CONCURRENT_EMBEDS", str(RAG_QUERY_WORKERS)))
+RAG_MAX_CONCURRENT_SEARCHES = int(os.getenv("RAG_MAX_CONCURRENT_SEARCHES", str(RAG_QUERY_WORKERS)))
+RAG_MAX_CONCURRENT_GENERATIONS = int(os.getenv("RAG_MAX_CONCURRENT_GENERATIONS", "32"))
+# concurrent query embeddings arriving within the wait window share one encode call
+RAG_QUERY_BATCHING = os.getenv("RAG_QUERY_BATCHING", "true").lower() == "true"
+RAG_QUERY_BATCH_MAX_SIZE = int(os.getenv("RAG_QUERY_BATCH_MAX_SIZE", "32"))
+RAG_QUERY_BATCH_WAIT_MS = float(os.getenv("RAG_QUERY_BATCH_WAIT_MS", "2"))
+# answers generated concurrently for one /rag/query/batch request
+RAG_BATCH_GENERATION_CONCURRENCY = int(os.getenv("RAG_BATCH_GENERATION_CONCURRENCY", "8"))
+# parallel per-partition searches when a query spans several uploaders
+RAG_PARTITION_SEARCH_WORKERS = int(os.getenv("RAG_PARTITION_SEARCH_WORKERS", "8"))
+# Chroma collection handles kept open; older ones are reopened on demand
+VECTOR_MAX_OPEN_PARTITIONS = int(os.getenv("VECTOR_MAX_OPEN_PARTITIONS", "256"))
+# retrieval used when a query does not choose one: "vector", "bm25" or "hybrid"
+RETRIEVAL_STRATEGIES = ("vector", "bm25", "hybrid")
+RAG_RETRIEVAL_STRATEGY = os.getenv("RAG_RETRIEVAL_STRATEGY", "vector").lower()
+# hybrid retrieval fuses the top (top_k * multiplier) hits of each retriever
+RAG_HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("RAG_HYBRID_CANDIDATE_MULTIPLIER", "4"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# optional reranking: retrieve RAG_RERANK_CANDIDATES chunks, then keep the top_k the
+# reranker ("cross-encoder" or the model-free "lexical") scores best
+RAG_RERANK = os.getenv("RAG_RERANK", "false").lower() == "true"
+RAG_RERANKER = os.getenv("RAG_RERANKER", "cross-encoder").lower()
+RAG_RERANK_MODEL_NAME = os.getenv("RAG_RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RAG_RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "20"))
+RAG_RERANK_MAX_CANDIDATES = int(os.getenv("RAG_RERANK_MAX_CANDIDATES", "100"))
+RAG_RERANK_BATCH_SIZE = int(os.getenv("RAG_RERANK_BATCH_SIZE", "32"))
+RAG_RERANK_CACHE_MAX_ENTRIES = int(os.getenv("RAG_RERANK_CACHE_MAX_ENTRIES", "10000"))
+RAG_MAX_CONCURRENT_RERANKS = int(os.getenv("RAG_MAX_CONCURRENT_RERANKS", str(RAG_QUERY_WORKERS)))
+# retrieved chunks are deduplicated and packed into at most this many context tokens (0: no limit)
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "3000"))
+# answer generation: "groq", "openai" (an OpenAI-compatible server at LLM_BASE_URL),
+# "stub" (deterministic local stub for load tests) or "none" (extractive answers)
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq" if GROQ_API_KEY else "none").lower()
+LLM_MODEL = os.getenv("LLM_MODEL")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+LLM_API_KEY = os.getenv("LLM_API_KEY", GROQ_API_KEY if LLM_PROVIDER == "groq" else None)
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.1"))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1024"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# the breaker rejects calls for LLM_CIRCUIT_RESET_SECONDS after this many consecutive failures
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "200"))
+LLM_STUB_TOKENS_PER_SECOND = float(os.getenv("LLM_STUB_TOKENS_PER_SECOND", "50"))
+LLM_STUB_ANSWER_TOKENS = int(os.getenv("LLM_STUB_ANSWER_TOKENS", "64"))
+LLM_STUB_FAILURE_RATE = float(os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+# written partitions are persisted together after this many documents or seconds; only
+# used by chromadb before 0.4, later versions write through and are durable on return
+VECTOR_PERSIST_MAX_PENDING = int(os.getenv("VECTOR_PERSIST_MAX_PENDING", "50"))
+VECTOR_PERSIST_INTERVAL_SECONDS = float(os.getenv("VECTOR_PERSIST_INTERVAL_SECONDS", "5"))
+
+_query_executor = ThreadPoolExecutor(max_workers=RAG_QUERY_WORKERS, thread_name_prefix="rag-query")
+_embed_semaphore = asyncio.Semaphore(RAG_MAX_CONCURRENT_EMBEDS)
+_search_semaphore = asyncio.Semaphore(RAG_MAX_CONCURRENT_SEARCHES)
+_generation_semaphore = asyncio.Semaphore(RAG_MAX_CONCURRENT_GENERATIONS)
+_rerank_semaphore = asyncio.Semaphore(RAG_MAX_CONCURRENT_RERANKS)
+# context assembly (tokenizing, merging, truncating) only competes for the executor itself
+_context_semaphore = asyncio.Semaphore(RAG_QUERY_WORKERS)
 
-vector_store = Chroma(
-    persist_directory=CHROMA_PERSIST_DIRECTORY,
-    embedding_function=EMBEDDINGS
+QUERY_STAGE_SECONDS = REGISTRY.histogram(
+    "rag_query_stage_duration_seconds",
+    "Time a query spends in each stage: embed, embed_batch, search, rerank, prompt_build, llm, llm_first_token.",
+    ("stage",)
 )
+INGEST_STAGE_SECONDS = REGISTRY.histogram(
+    "rag_ingest_stage_duration_seconds",
+    "Ingestion time per page (load, split), per chunk batch (embed, vector_upsert, bm25_index) and per persist flush (persist).",
+    ("stage",)
+)
+LLM_GENERATIONS_IN_FLIGHT = REGISTRY.gauge("rag_llm_generations_in_flight", "Answer generations waiting on the LLM.")
+
+query_batcher = QueryEmbeddingBatcher(
+    embed_batch=lambda texts: get_embeddings().embed_queries(texts),
+    executor=_query_executor,
+    max_batch_size=RAG_QUERY_BATCH_MAX_SIZE,
+    max_wait_ms=RAG_QUERY_BATCH_WAIT_MS,
+    max_concurrent_batches=RAG_MAX_CONCURRENT_EMBEDS
+)
+
+def _persist_partitions(partitions: List[str]):
+    with INGEST_STAGE_SECONDS.labels("persist").time():
+        for partition in partitions:
+            get_vector_index().persist(partition)
+
+persist_scheduler = PersistScheduler(
+    _persist_partitions,
+    max_pending=VECTOR_PERSIST_MAX_PENDING,
+    max_delay_seconds=VECTOR_PERSIST_INTERVAL_SECONDS,
+    enabled=persist_required()
+)
+
+os.makedirs(DOCUMENT_STORE_PATH, exist_ok=True)
+os.makedirs(CHROMA_PERSIST_DIRECTORY, exist_ok=True)
 
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=1000,
@@ -38,22 +170,229 @@ text_splitter = RecursiveCharacterTextSplitter(
     length_function=len,
 )
 
-groq_api_key = os.getenv("GROQ_API_KEY")
-if groq_api_key:
-    try:
-        llm = ChatGroq(
-            groq_api_key=groq_api_key,
-            model_name="llama3-8b-8192", 
-            temperature=0.1,
-            max_tokens=1024
+# The embedding model (torch, transformers), the Chroma client and the LLM client
+# are expensive to import and construct, so they are created on first use (or by
+# warm_up at startup) instead of at import time.
+_model_lock = threading.RLock()
+_embeddings: Optional[CachedEmbeddings] = None
+_vector_index: Optional[PartitionedIndex] = None
+_sparse_index: Optional[SparseIndex] = None
+_reranker: Optional[Reranker] = None
+_llm_provider: Optional[LLMProvider] = None
+_llm_initialized = False
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """
+    This function returns the shared embeddings model, loading it on first use.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _model_lock:
+            if _embeddings is None:
+                _embeddings = CachedEmbeddings(
+                    create_embeddings(
+                        backend=EMBEDDING_BACKEND,
+                        model_name=EMBEDDING_MODEL_NAME,
+                        batch_size=EMBEDDING_BATCH_SIZE,
+                        model_directory=EMBEDDING_ONNX_DIRECTORY,
+                        onnx_threads=EMBEDDING_ONNX_THREADS
+                    ),
+                    directory=EMBEDDING_CACHE_DIRECTORY,
+                    batch_size=EMBEDDING_BATCH_SIZE,
+                    processes=EMBEDDING_PROCESSES,
+                    multi_process_min_texts=EMBEDDING_MULTI_PROCESS_MIN_TEXTS
+                )
+                logger.info("Embedding model %s loaded with %s backend.", EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+    return _embeddings
+
+
+def get_vector_index() -> PartitionedIndex:
+    """
+    This function returns the shared partitioned vector index, opening it on first use.
+    """
+    global _vector_index
+    if _vector_index is None:
+        with _model_lock:
+            if _vector_index is None:
+                _vector_index = PartitionedIndex(
+                    persist_directory=CHROMA_PERSIST_DIRECTORY,
+                    embedding_function=get_embeddings(),
+                    search_workers=RAG_PARTITION_SEARCH_WORKERS,
+                    max_open_partitions=VECTOR_MAX_OPEN_PARTITIONS
+                )
+                logger.info("Vector index opened.")
+    return _vector_index
+
+
+def get_sparse_index() -> SparseIndex:
+    """
+    This function returns the shared BM25 keyword index, opening it on first use.
+    """
+    global _sparse_index
+    if _sparse_index is None:
+        with _model_lock:
+            if _sparse_index is None:
+                _sparse_index = SparseIndex(SPARSE_INDEX_PATH)
+                logger.info("Sparse index opened.")
+    return _sparse_index
+
+
+def get_reranker() -> Reranker:
+    """
+    This function returns the shared reranker, loading its model on first use.
+    """
+    global _reranker
+    if _reranker is None:
+        with _model_lock:
+            if _reranker is None:
+                _reranker = create_reranker(
+                    RAG_RERANKER,
+                    model_name=RAG_RERANK_MODEL_NAME,
+                    batch_size=RAG_RERANK_BATCH_SIZE,
+                    cache_max_entries=RAG_RERANK_CACHE_MAX_ENTRIES
+                )
+                logger.info("Reranker %s loaded.", RAG_RERANKER)
+    return _reranker
+
+
+def get_llm_provider() -> Optional[LLMProvider]:
+    """
+    This function returns the LLM provider used for answer generation, or None when
+    LLM_PROVIDER is "none".
+    """
+    global _llm_provider, _llm_initialized
+    if not _llm_initialized:
+        with _model_lock:
+            if not _llm_initialized:
+                _llm_provider = create_llm_provider(
+                    LLM_PROVIDER,
+                    model=LLM_MODEL,
+                    base_url=LLM_BASE_URL,
+                    api_key=LLM_API_KEY,
+                    temperature=LLM_TEMPERATURE,
+                    max_tokens=LLM_MAX_TOKENS,
+                    timeout_seconds=LLM_TIMEOUT_SECONDS,
+                    connect_timeout_seconds=LLM_CONNECT_TIMEOUT_SECONDS,
+                    max_connections=RAG_MAX_CONCURRENT_GENERATIONS,
+                    max_retries=LLM_MAX_RETRIES,
+                    circuit_failure_threshold=LLM_CIRCUIT_FAILURE_THRESHOLD,
+                    circuit_reset_seconds=LLM_CIRCUIT_RESET_SECONDS,
+                    stub_options={
+                        "first_token_latency_ms": LLM_STUB_LATENCY_MS,
+                        "tokens_per_second": LLM_STUB_TOKENS_PER_SECOND,
+                        "answer_tokens": LLM_STUB_ANSWER_TOKENS,
+                        "failure_rate": LLM_STUB_FAILURE_RATE,
+                    }
+                )
+                if _llm_provider is None:
+                    logger.warning("No LLM provider configured; answers are extracts of the retrieved context.")
+                else:
+                    logger.info("LLM provider %s initialized.", LLM_PROVIDER)
+                _llm_initialized = True
+    return _llm_provider
+
+
+def set_llm_provider(provider: Optional[LLMProvider]):
+    """
+    This function swaps the LLM provider used for answer generation, e.g. a
+    StubProvider in tests; None switches to extractive answers.
+    """
+    global _llm_provider, _llm_initialized
+    with _model_lock:
+        _llm_provider = provider
+        _llm_initialized = True
+
+
+def reranker_status() -> Dict[str, Any]:
+    """
+    This function reports the reranker's score cache counters, once it is loaded.
+    """
+    if _reranker is None:
+        return {"reranker": RAG_RERANKER, "loaded": False}
+    return {**_reranker.stats(), "loaded": True}
+
+
+def llm_status() -> Dict[str, Any]:
+    """
+    This function reports the configured LLM provider and its circuit breaker state.
+    """
+    provider = get_llm_provider()
+    if provider is None:
+        return {"provider": "none"}
+    return provider.stats()
+
+
+def warm_up():
+    """
+    This function loads every model eagerly and runs one embedding so the first
+    request does not pay for it. It is blocking; call it off the event loop.
+    """
+    get_embeddings().embed_query("warm up")
+    get_vector_index()
+    if RAG_RERANK:
+        get_reranker()
+    get_llm_provider()
+    # loads the tokenizer the context budget is counted with
+    count_tokens("warm up")
+    logger.info("RAG models warmed up.")
+
+
+def model_status() -> Dict[str, bool]:
+    """
+    This function reports which lazily loaded components are ready.
+    """
+    return {
+        "embeddings_loaded": _embeddings is not None,
+        "vector_index_loaded": _vector_index is not None,
+        "reranker_loaded": _reranker is not None,
+        "llm_initialized": _llm_initialized,
+        "llm_provider": LLM_PROVIDER,
+    }
+
+
+def close_models():
+    """
+    This function releases resources held by loaded models (e.g. encoder processes).
+    """
+    if _embeddings is not None:
+        _embeddings.close()
+    shutdown_parse_pool()
+
+
+async def close_llm_provider():
+    """
+    This function closes the LLM provider's pooled HTTP connections.
+    """
+    if _llm_provider is not None:
+        await _llm_provider.aclose()
+
+
+def _collect_metrics():
+    yield (
+        "rag_query_embedding_queue_wait_milliseconds", "histogram",
+        "Time a query waits for its micro-batched embedding to start.", [({}, query_batcher.queue_wait_ms)]
+    )
+    yield (
+        "rag_query_embedding_batch_size", "histogram",
+        "Queries encoded per micro-batched embedding call.", [({}, query_batcher.batch_size)]
+    )
+    persistence = persist_scheduler.stats()
+    yield ("vector_persist_pending_documents", "gauge", "Documents written but not yet persisted.", [({}, persistence["pending_documents"])])
+    yield ("vector_persist_flushes_total", "counter", "Coalesced vector index persists.", [({}, persistence["flushes"])])
+    yield ("vector_persist_flush_errors_total", "counter", "Vector index persists that failed.", [({}, persistence["flush_errors"])])
+    if _llm_provider is not None:
+        breaker = _llm_provider.breaker.stats()
+        yield (
+            "llm_circuit_breaker_state", "gauge", "1 for the LLM circuit breaker's current state.",
+            [({"state": state}, int(breaker["state"] == state)) for state in ("closed", "open", "half_open")]
         )
-        logger.info("Groq API initialized successfully.")
-    except Exception as e:
-        logger.error(f"Error initializing Groq API: {e}")
-        llm = None
-else:
-    logger.warning("GROQ_API_KEY not found in environment variables. Answer generation will be limited.")
-    llm = None
+        yield ("llm_circuit_breaker_rejected_total", "counter", "LLM calls rejected by the open circuit breaker.", [({}, breaker["rejected_calls"])])
+
+
+REGISTRY.register_collector(_collect_metrics)
+REGISTRY.register_collector(cache_collector("embedding", lambda: _embeddings.stats() if _embeddings is not None else None))
+REGISTRY.register_collector(cache_collector("rerank", lambda: _reranker.stats() if _reranker is not None else None))
 
 # simple prompt template for the RAG
 qa_template = """
@@ -69,106 +408,521 @@ Question: {question}
 Answer:
 """
 
+NO_RESULTS_ANSWER = "No relevant information found to answer your question."
+
 QA_PROMPT = PromptTemplate(
     template=qa_template,
     input_variables=["context", "question"]
 )
 
-def get_document_loader(file_path: str, file_type: str):
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_SIZE."""
+
+
+async def save_upload(upload, file_extension: str, storage_name: str) -> Dict[str, Any]:
     """
-    This function gets the appropriate document loader based on file type.
+    This function streams an upload in UPLOAD_CHUNK_SIZE chunks to its final location
+    in the document store, hashing it on the way. Peak memory is one chunk. The file is
+    written under a temporary name and only renamed into place once complete.
+    By the time it runs the multipart parser has already spooled the whole file to a
+    temporary file; UploadSizeLimitMiddleware keeps oversize bodies from getting there.
     """
-    if file_type.lower() == 'pdf':
-        return PyPDFLoader(file_path)
-    elif file_type.lower() == 'txt':
-        return TextLoader(file_path)
-    else:
-        raise ValueError(f"Unsupported file type: {file_type}")
+    document_path = os.path.join(DOCUMENT_STORE_PATH, f"{storage_name}.{file_extension}")
+    partial_path = f"{document_path}.part"
+    loop = asyncio.get_running_loop()
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(partial_path, 'wb') as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise UploadTooLargeError(f"File exceeds the maximum upload size of {MAX_UPLOAD_SIZE} bytes")
+                hasher.update(chunk)
+                await loop.run_in_executor(None, f.write, chunk)
+        os.replace(partial_path, document_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+    
+    return {
+        "file_path": document_path,
+        "file_type": file_extension,
+        "content_hash": hasher.hexdigest(),
+        "size": size
+    }
 
-async def process_document(
-    content: bytes,
-    filename: str,
+def legacy_chunk_hashes(file_path: str, file_type: str) -> List[str]:
+    """
+    This function re-splits a stored document the way documents were indexed before
+    ingestion was streamed (one langchain loader pass, then the text splitter) and
+    returns the content hash of every chunk, repeats included, so legacy chunks can
+    be matched to the document they came from.
+    """
+    from langchain.document_loaders import PyPDFLoader, TextLoader
+
+    loader = PyPDFLoader(file_path) if file_type.lower() == "pdf" else TextLoader(file_path)
+    return [content_hash(chunk.page_content) for chunk in text_splitter.split_documents(loader.load())]
+
+def iter_page_chunks(
+    file_path: str,
+    metadata: Optional[Dict[str, Any]] = None
+) -> Iterator[List[ChunkDocument]]:
+    """
+    This function parses a stored document lazily and yields, page by page, the chunks
+    not already seen earlier in the document. Each chunk carries `metadata` and its
+    own `chunk_hash`.
+    """
+    seen_hashes = set()
+    load_seconds, split_seconds = INGEST_STAGE_SECONDS.labels("load"), INGEST_STAGE_SECONDS.labels("split")
+    pages = iter_document_pages(file_path, file_path.split('.')[-1].lower())
+    while True:
+        with load_seconds.time():
+            page = next(pages, None)
+        if page is None:
+            break
+        chunks = []
+        with split_seconds.time():
+            for split in text_splitter.split_documents([page]):
+                chunk_hash = content_hash(split.page_content)
+                if chunk_hash in seen_hashes:
+                    continue
+                seen_hashes.add(chunk_hash)
+                split.metadata.update(metadata or {})
+                split.metadata["chunk_hash"] = chunk_hash
+                chunks.append(split)
+        yield chunks
+
+def process_document(
+    file_path: str,
     title: str,
-    description: Optional[str] = None
+    description: Optional[str] = None,
+    progress: Optional[Callable[..., None]] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+    collection_name: Optional[str] = None
 ) -> Dict[str, Any]:
     """
-    Process a document by splitting it into chunks and storing in the vector store.
+    Process a stored document by splitting it into chunks and storing them in the
+    vector index partition `collection_name` (the uploader's; the legacy collection if not given).
+    `metadata` (e.g. document and uploader ids) is attached to every chunk so
+    searches can be filtered on it, together with the chunk's own `chunk_hash`.
+    Chunks repeated within the document are only embedded and stored once.
+
+    Pages are parsed lazily (PDF page ranges on a process pool), split as they
+    arrive and embedded and written in batches of INGESTION_BATCH_SIZE chunks, so
+    memory stays bounded whatever the document size and parsing overlaps embedding.
+
+    This is blocking (parsing, embedding and persisting) and is meant to run on an
+    ingestion worker, not on the event loop. `progress` is called with keyword
+    arguments describing the current stage and counters. The partition is handed
+    to the persist scheduler, which flushes it later on chromadb versions that
+    need an explicit persist; the returned `persist_ticket` tells when it is durable.
+    """
+    report = progress or (lambda **_: None)
+    file_extension = file_path.split('.')[-1].lower()
+    collection_name = collection_name or LEGACY_PARTITION
+    num_pages = 0
+    num_chunks = 0
+    chunks_total = 0
+    batch = []
+
+    def flush():
+        nonlocal num_chunks
+        report(stage="embedding")
+        with INGEST_STAGE_SECONDS.labels("embed").time():
+            embeddings = get_embeddings().embed_documents([chunk.page_content for chunk in batch])
+        with INGEST_STAGE_SECONDS.labels("vector_upsert").time():
+            get_vector_index().add_embeddings(collection_name, batch, embeddings)
+        with INGEST_STAGE_SECONDS.labels("bm25_index").time():
+            get_sparse_index().add_documents(collection_name, batch)
+        num_chunks += len(batch)
+        report(stage="parsing", chunks_embedded=num_chunks)
+        batch.clear()
+
+    report(stage="parsing")
+    for page_chunks in iter_page_chunks(file_path, metadata):
+        num_pages += 1
+        chunks_total += len(page_chunks)
+        for chunk in page_chunks:
+            batch.append(chunk)
+            if len(batch) >= INGESTION_BATCH_SIZE:
+                flush()
+        report(pages_parsed=num_pages, chunks_total=chunks_total)
+    if batch:
+        flush()
+    answer_cache.invalidate()
+
+    persist_ticket = persist_scheduler.mark_dirty(collection_name)
+    report(persist_ticket=persist_ticket)
+
+    return {
+        "title": title,
+        "description": description,
+        "file_path": file_path,
+        "file_type": file_extension,
+        "collection_name": collection_name,
+        "num_pages": num_pages,
+        "num_chunks": num_chunks,
+        "persist_ticket": persist_ticket
+    }
+
+def delete_document_index(collection_name: Optional[str], document_id: int):
+    """
+    This function removes the chunks tagged with `document_id` from a document's
+    partition (its uploader's, or the legacy collection when it has none), or drops
+    a per-document doc_* partition whole.
+    """
+    if collection_name and is_document_partition(collection_name):
+        get_vector_index().delete_partition(collection_name)
+        get_sparse_index().delete_partition(collection_name)
+    else:
+        get_vector_index().delete_where(collection_name or LEGACY_PARTITION, {"document_id": document_id})
+        get_sparse_index().delete_where(collection_name or LEGACY_PARTITION, {"document_id": document_id})
+    answer_cache.invalidate()
+
+async def _run_blocking(semaphore: asyncio.Semaphore, func, *args, **kwargs):
+    """
+    This function runs a blocking call on the query executor under a stage semaphore.
+    """
+    async with semaphore:
+        loop = asyncio.get_running_loop()
+        # copy the context so records logged on the executor thread keep the request id
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(_query_executor, functools.partial(context.run, func, *args, **kwargs))
+
+def _build_context(retrieved_docs) -> str:
+    with QUERY_STAGE_SECONDS.labels("prompt_build").time():
+        assembled = assemble_context(retrieved_docs, RAG_CONTEXT_TOKEN_BUDGET)
+    logger.debug(
+        "Context of %s tokens from %s (%s passages, %s duplicates dropped)",
+        assembled["tokens"], assembled["source_tokens"], assembled["passages"], assembled["duplicates_dropped"]
+    )
+    return assembled["context"]
+
+def _fallback_answer(context: str) -> str:
+    return f"Based on the retrieved information, here's what I found: {context[:500]}..."
+
+def _format_sources(docs) -> List[Dict[str, Any]]:
+    return [{"content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+async def generate_answer(query: str, retrieved_docs) -> str:
     """
-    file_extension = filename.split('.')[-1].lower()
-    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_file:
-        temp_file.write(content)
-        temp_file_path = temp_file.name
+    This function generates an answer to the query based on retrieved documents with
+    the configured LLM provider. Without one the answer is an extract of the context;
+    provider failures raise LLMProviderError.
+    """
+    if not retrieved_docs:
+        return NO_RESULTS_ANSWER
+    context = await _run_blocking(_context_semaphore, _build_context, retrieved_docs)
     
+    provider = get_llm_provider()
+    if provider is None:
+        return _fallback_answer(context)
+    formatted_prompt = QA_PROMPT.format(context=context, question=query)
+    LLM_GENERATIONS_IN_FLIGHT.inc()
     try:
-        # 1. loading the document
-        loader = get_document_loader(temp_file_path, file_extension)
-        documents = loader.load()
-
-        # 2. splitting the document into chunks
-        splits = text_splitter.split_documents(documents)
-
-        # 3. adding the document chunks to the vector store
-        collection_name = f"doc_{uuid.uuid4().hex}"
-        document_ids = vector_store.add_documents(
-            splits,
-            collection_name=collection_name
-        )
-        vector_store.persist()
-        document_path = os.path.join(DOCUMENT_STORE_PATH, f"{collection_name}.{file_extension}")
-        with open(document_path, 'wb') as f:
-            f.write(content)
-
-        return {
-            "title": title,
-            "description": description,
-            "file_path": document_path,
-            "file_type": file_extension,
-            "collection_name": collection_name,
-            "num_chunks": len(splits)
-        }
+        async with _generation_semaphore:
+            with QUERY_STAGE_SECONDS.labels("llm").time():
+                return await provider.generate(formatted_prompt)
     finally:
-        if os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
+        LLM_GENERATIONS_IN_FLIGHT.dec()
 
-async def generate_answer(query: str, retrieved_docs) -> str:
+async def stream_answer(query: str, retrieved_docs) -> AsyncIterator[str]:
     """
-    This function generates an answer to the query based on retrieved documents using Groq API.
+    This function streams the answer to the query token by token as the LLM produces it.
     """
     if not retrieved_docs:
-        return "No relevant information found to answer your question."
-    context = "\n\n".join([doc.page_content for doc in retrieved_docs])
+        yield NO_RESULTS_ANSWER
+        return
+    context = await _run_blocking(_context_semaphore, _build_context, retrieved_docs)
     
-    if llm is not None:
-        try:
-            formatted_prompt = QA_PROMPT.format(context=context, question=query)
-            response = llm.invoke(formatted_prompt)
-            return response.content
-        except Exception as e:
-            logger.error(f"Error generating answer with Groq: {e}")
-            return f"Based on the retrieved information, here's what I found: {context[:500]}..."
-    else:
-        return f"Based on the retrieved information, here's what I found: {context[:500]}..."
+    provider = get_llm_provider()
+    if provider is None:
+        yield _fallback_answer(context)
+        return
+    
+    formatted_prompt = QA_PROMPT.format(context=context, question=query)
+    LLM_GENERATIONS_IN_FLIGHT.inc()
+    try:
+        async with _generation_semaphore:
+            started = time.perf_counter()
+            first_token = True
+            with QUERY_STAGE_SECONDS.labels("llm").time():
+                async for text in provider.stream(formatted_prompt):
+                    if first_token:
+                        QUERY_STAGE_SECONDS.labels("llm_first_token").observe(time.perf_counter() - started)
+                        first_token = False
+                    yield text
+    finally:
+        LLM_GENERATIONS_IN_FLIGHT.dec()
+
+async def embed_query(query: str) -> List[float]:
+    """
+    This function embeds a query on the query executor, micro-batched with concurrent queries.
+    """
+    with QUERY_STAGE_SECONDS.labels("embed").time():
+        if RAG_QUERY_BATCHING:
+            return await query_batcher.embed(query)
+        return await _run_blocking(_embed_semaphore, lambda: get_embeddings().embed_query(query))
 
-async def query_documents(query: str, top_k: int = 5) -> Dict[str, Any]:
+async def search_documents(
+    query_embedding: List[float],
+    top_k: int = 5,
+    partitions: Optional[Dict[str, Optional[Dict[str, Any]]]] = None
+):
+    """
+    This function searches the selected index partitions for the top_k chunks closest
+    to the embedding. `partitions` maps partition names to an optional Chroma metadata
+    filter applied inside that partition's search; by default only the legacy
+    collection is searched.
+    """
+    if partitions is None:
+        partitions = {LEGACY_PARTITION: None}
+    return await _run_blocking(
+        _search_semaphore,
+        lambda: get_vector_index().search(partitions, query_embedding, top_k)
+    )
+
+async def search_keywords(
+    query: str,
+    top_k: int = 5,
+    partitions: Optional[Dict[str, Optional[Dict[str, Any]]]] = None
+):
+    """
+    This function searches the selected partitions' BM25 index for the top_k chunks
+    matching the query's terms. Chunks indexed before the keyword index existed are
+    not found this way.
+    """
+    if partitions is None:
+        partitions = {LEGACY_PARTITION: None}
+    return await _run_blocking(
+        _search_semaphore,
+        lambda: get_sparse_index().search(partitions, query, top_k)
+    )
+
+def _retrieval_strategy(retrieval: Optional[str]) -> str:
+    retrieval = (retrieval or RAG_RETRIEVAL_STRATEGY).lower()
+    if retrieval not in RETRIEVAL_STRATEGIES:
+        raise ValueError(f"Unsupported retrieval strategy: {retrieval}. Expected one of {', '.join(RETRIEVAL_STRATEGIES)}")
+    return retrieval
+
+async def search_hybrid(
+    query: str,
+    query_embedding: List[float],
+    top_k: int = 5,
+    partitions: Optional[Dict[str, Optional[Dict[str, Any]]]] = None,
+    vector_weight: float = 1.0,
+    bm25_weight: float = 1.0
+):
+    """
+    This function runs the vector and BM25 searches side by side over
+    top_k * RAG_HYBRID_CANDIDATE_MULTIPLIER candidates each and fuses them by
+    weighted reciprocal rank into the top_k chunks.
+    """
+    candidates = top_k * RAG_HYBRID_CANDIDATE_MULTIPLIER
+    dense, sparse = await asyncio.gather(
+        search_documents(query_embedding, candidates, partitions),
+        search_keywords(query, candidates, partitions)
+    )
+    return reciprocal_rank_fusion([(dense, vector_weight), (sparse, bm25_weight)], top_k, RAG_RRF_K)
+
+def _rerank_candidates(rerank: Optional[bool], rerank_candidates: Optional[int], top_k: int) -> Optional[int]:
+    """The number of candidates to retrieve for reranking, or None when not reranking."""
+    if not (RAG_RERANK if rerank is None else rerank):
+        return None
+    return max(min(rerank_candidates or RAG_RERANK_CANDIDATES, RAG_RERANK_MAX_CANDIDATES), top_k)
+
+async def rerank_documents(query: str, docs, top_k: int):
+    """
+    This function rescores retrieved chunks with the reranker on the query executor
+    and returns the top_k best, best first.
+    """
+    with QUERY_STAGE_SECONDS.labels("rerank").time():
+        return await _run_blocking(_rerank_semaphore, lambda: get_reranker().rerank(query, docs, top_k))
+
+async def retrieve_documents(
+    query: str,
+    top_k: int = 5,
+    partitions: Optional[Dict[str, Optional[Dict[str, Any]]]] = None,
+    query_embedding: Optional[List[float]] = None,
+    retrieval: Optional[str] = None,
+    vector_weight: float = 1.0,
+    bm25_weight: float = 1.0,
+    rerank: Optional[bool] = None,
+    rerank_candidates: Optional[int] = None
+):
+    """
+    This function searches the selected partitions for the top_k chunks with the given
+    retrieval strategy ("vector", "bm25" or "hybrid"; RAG_RETRIEVAL_STRATEGY by
+    default), embedding the query when needed and not given. With reranking
+    (RAG_RERANK by default) `rerank_candidates` chunks are retrieved and the reranker
+    keeps the top_k.
+    """
+    retrieval = _retrieval_strategy(retrieval)
+    candidates = _rerank_candidates(rerank, rerank_candidates, top_k)
+    fetch_k = candidates or top_k
+    if retrieval != "bm25" and query_embedding is None:
+        query_embedding = await embed_query(query)
+    with QUERY_STAGE_SECONDS.labels("search").time():
+        if retrieval == "bm25":
+            docs = await search_keywords(query, fetch_k, partitions)
+        elif retrieval == "hybrid":
+            docs = await search_hybrid(query, query_embedding, fetch_k, partitions, vector_weight, bm25_weight)
+        else:
+            docs = await search_documents(query_embedding, fetch_k, partitions)
+    if candidates is None:
+        return docs
+    return await rerank_documents(query, docs, top_k)
+
+def _cache_scope(
+    partitions: Optional[Dict[str, Optional[Dict[str, Any]]]],
+    retrieval: str = "vector",
+    vector_weight: float = 1.0,
+    bm25_weight: float = 1.0,
+    rerank_candidates: Optional[int] = None
+) -> Optional[str]:
+    if retrieval != "vector" or rerank_candidates:
+        partitions = {
+            "partitions": partitions,
+            "retrieval": retrieval,
+            "weights": [vector_weight, bm25_weight],
+            "rerank": rerank_candidates
+        }
+    if partitions is None:
+        return None
+    return hashlib.sha1(json.dumps(partitions, sort_keys=True).encode("utf-8")).hexdigest()
+
+async def query_documents(
+    query: str,
+    top_k: int = 5,
+    partitions: Optional[Dict[str, Optional[Dict[str, Any]]]] = None,
+    query_embedding: Optional[List[float]] = None,
+    retrieval: Optional[str] = None,
+    vector_weight: float = 1.0,
+    bm25_weight: float = 1.0,
+    rerank: Optional[bool] = None,
+    rerank_candidates: Optional[int] = None
+) -> Dict[str, Any]:
     """
     This function queries the document store with a question and generates an answer.
+    Answers are served from the answer cache when the same or a semantically
+    equivalent question was answered since the last upload, over the same partitions
+    and retrieval and rerank settings. Keyword (bm25, hybrid) retrieval only uses exact cache
+    hits, since near-identical embeddings can differ in the identifiers they ask for.
+    A precomputed `query_embedding` skips the embedding step.
     """
-    retriever = vector_store.as_retriever(
-        search_kwargs={"k": top_k}
+    retrieval = _retrieval_strategy(retrieval)
+    cache_version = answer_cache.version
+    scope = _cache_scope(
+        partitions, retrieval, vector_weight, bm25_weight, _rerank_candidates(rerank, rerank_candidates, top_k)
     )
-    docs = retriever.get_relevant_documents(query)
-    answer = await generate_answer(query, docs)
+    cached = answer_cache.get_exact(query, top_k, scope)
+    if cached is not None:
+        return {**cached, "query": query}
     
-    results = []
-    for doc in docs:
-        results.append({
-            "content": doc.page_content,
-            "metadata": doc.metadata
-        })
+    if query_embedding is None and retrieval != "bm25":
+        query_embedding = await embed_query(query)
+    if retrieval == "vector":
+        cached = answer_cache.get_semantic(query_embedding, top_k, scope)
+        if cached is not None:
+            return {**cached, "query": query}
+    else:
+        answer_cache.record_miss()
     
-    return {
+    docs = await retrieve_documents(
+        query, top_k, partitions, query_embedding, retrieval, vector_weight, bm25_weight, rerank, rerank_candidates
+    )
+    answer = await generate_answer(query, docs)
+    results = _format_sources(docs)
+    
+    response = {
         "query": query,
         "answer": answer,
         "sources": results,
         "num_results": len(results)
-    } 
\ No newline at end of file
+    }
+    answer_cache.put(query, top_k, query_embedding, response, version=cache_version, scope=scope)
+    return response
+
+async def query_documents_batch(
+    requests: List[Dict[str, Any]],
+    generation_concurrency: int = RAG_BATCH_GENERATION_CONCURRENCY
+) -> List[Dict[str, Any]]:
+    """
+    This function answers many queries at once. Each request is a dict with `query`,
+    `top_k`, `partitions` and optionally the retrieval and rerank settings, as taken by
+    query_documents. All queries are embedded in
+    one encode call, then searched and answered concurrently with at most
+    `generation_concurrency` in flight. Results keep the request order; each is
+    {"result": ..., "error": None} or {"result": None, "error": "..."}.
+    """
+    if not requests:
+        return []
+    texts = [request["query"] for request in requests]
+    try:
+        with QUERY_STAGE_SECONDS.labels("embed_batch").time():
+            embeddings = await _run_blocking(_embed_semaphore, lambda: get_embeddings().embed_queries(texts))
+    except Exception as e:
+        logger.error("Error embedding query batch: %s", e)
+        return [{"result": None, "error": f"Error embedding query: {str(e)}"} for _ in requests]
+    
+    limiter = asyncio.Semaphore(generation_concurrency)
+    
+    async def run_one(request: Dict[str, Any], query_embedding: List[float]) -> Dict[str, Any]:
+        async with limiter:
+            try:
+                result = await query_documents(
+                    query=request["query"],
+                    top_k=request.get("top_k", 5),
+                    partitions=request.get("partitions"),
+                    query_embedding=query_embedding,
+                    retrieval=request.get("retrieval"),
+                    vector_weight=request.get("vector_weight", 1.0),
+                    bm25_weight=request.get("bm25_weight", 1.0),
+                    rerank=request.get("rerank"),
+                    rerank_candidates=request.get("rerank_candidates")
+                )
+                return {"result": result, "error": None}
+            except Exception as e:
+                logger.error("Error answering batched query: %s", e)
+                return {"result": None, "error": f"Error querying documents: {str(e)}"}
+    
+    return await asyncio.gather(*[
+        run_one(request, query_embedding) for request, query_embedding in zip(requests, embeddings)
+    ])
+
+async def stream_query_documents(
+    query: str,
+    top_k: int = 5,
+    partitions: Optional[Dict[str, Optional[Dict[str, Any]]]] = None,
+    retrieval: Optional[str] = None,
+    vector_weight: float = 1.0,
+    bm25_weight: float = 1.0,
+    rerank: Optional[bool] = None,
+    rerank_candidates: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    This function queries the document store and yields events: the retrieved sources
+    first, then answer tokens as they are generated, then a final done event.
+    """
+    docs = await retrieve_documents(
+        query, top_k, partitions, retrieval=retrieval, vector_weight=vector_weight, bm25_weight=bm25_weight,
+        rerank=rerank, rerank_candidates=rerank_candidates
+    )
+    results = _format_sources(docs)
+    yield {
+        "event": "sources",
+        "data": {"query": query, "sources": results, "num_results": len(results)}
+    }
+    
+    try:
+        async for token in stream_answer(query, docs):
+            yield {"event": "token", "data": token}
+    except LLMProviderError as e:
+        logger.error("Error streaming answer: %s", e)
+        yield {"event": "error", "data": f"Error generating answer: {e}"}
+    
+    yield {"event": "done", "data": None}
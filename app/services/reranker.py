@@ -0,0 +1,163 @@
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from langchain.schema import Document as ChunkDocument
+import logging
+
+from app.services.vector_index import chunk_key
+
+logger = logging.getLogger(__name__)
+
+RERANKERS = ("cross-encoder", "lexical")
+
+_TERM_PATTERN = re.compile(r"\w[\w\-]*")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from has have how i in is it of on or that the this to was "
+    "were what when where which who why with".split()
+)
+
+
+class Reranker(ABC):
+    """
+    Rescores retrieved chunks against the query and keeps the best ones.
+
+    Subclasses implement `_score` for a batch of texts. Scores are cached per
+    (query, chunk) pair, so chunks retrieved again for a repeated query, or by
+    another request for the same query, are not scored twice.
+    """
+
+    name = "base"
+
+    def __init__(self, batch_size: int = 32, cache_max_entries: int = 10000):
+        self.batch_size = batch_size
+        self.cache_max_entries = cache_max_entries
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @abstractmethod
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        """Returns the relevance of each text to the query, higher is better."""
+
+    def scores(self, query: str, docs: List[ChunkDocument]) -> List[float]:
+        """
+        This function returns each chunk's relevance to the query (higher is better),
+        scoring only the pairs not already cached, in batches of `batch_size`.
+        """
+        keys = [(query, chunk_key(doc)) for doc in docs]
+        scores: Dict[Tuple[str, str], float] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+            self._hits += len(scores)
+        missing = {key: doc.page_content for key, doc in zip(keys, docs) if key not in scores}
+        if missing:
+            missing_keys, texts = list(missing), list(missing.values())
+            for start in range(0, len(texts), self.batch_size):
+                batch_scores = self._score(query, texts[start:start + self.batch_size])
+                scores.update(zip(missing_keys[start:start + self.batch_size], map(float, batch_scores)))
+            with self._lock:
+                self._misses += len(missing)
+                for key in missing_keys:
+                    self._cache[key] = scores[key]
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_max_entries:
+                    self._cache.popitem(last=False)
+        return [scores[key] for key in keys]
+
+    def rerank(self, query: str, docs: List[ChunkDocument], k: int) -> List[ChunkDocument]:
+        """
+        This function returns the k chunks scoring best against the query, best first;
+        ties keep their retrieval order.
+        """
+        if not docs:
+            return []
+        scores = self.scores(query, docs)
+        order = sorted(range(len(docs)), key=lambda index: -scores[index])
+        return [docs[index] for index in order[:k]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "reranker": self.name,
+                "entries": len(self._cache),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    A sentence-transformers cross-encoder (e.g. ms-marco-MiniLM-L-6-v2) reading the
+    query and each chunk together; needs torch and sentence-transformers.
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str, max_length: int = 512, **kwargs):
+        super().__init__(**kwargs)
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        return self.model.predict(
+            [(query, text) for text in texts],
+            batch_size=self.batch_size,
+            show_progress_bar=False
+        ).tolist()
+
+
+def _terms(text: str) -> List[str]:
+    return [term for term in _TERM_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+class LexicalReranker(Reranker):
+    """
+    A model-free reranker: the share of the query's terms a chunk contains, averaged
+    with the share found together in its best sentence, so chunks where the terms
+    occur side by side beat chunks mentioning them far apart. Needs no model and
+    costs microseconds per chunk, at a fraction of a cross-encoder's quality.
+    """
+
+    name = "lexical"
+
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        query_terms = set(_terms(query))
+        if not query_terms:
+            return [0.0] * len(texts)
+        scores = []
+        for text in texts:
+            coverage = len(query_terms.intersection(_terms(text))) / len(query_terms)
+            best_sentence = max(
+                (len(query_terms.intersection(_terms(sentence))) for sentence in _SENTENCE_PATTERN.split(text)),
+                default=0
+            ) / len(query_terms)
+            scores.append((coverage + best_sentence) / 2)
+        return scores
+
+
+def create_reranker(
+    reranker: str,
+    model_name: str,
+    batch_size: int = 32,
+    cache_max_entries: int = 10000
+) -> Reranker:
+    """
+    This function builds the reranker: "cross-encoder" (a sentence-transformers
+    cross-encoder model) or "lexical" (model-free term proximity scoring).
+    """
+    if reranker == "cross-encoder":
+        return CrossEncoderReranker(model_name, batch_size=batch_size, cache_max_entries=cache_max_entries)
+    if reranker == "lexical":
+        return LexicalReranker(batch_size=batch_size, cache_max_entries=cache_max_entries)
+    raise ValueError(f"Unsupported reranker: {reranker}. Expected one of {', '.join(RERANKERS)}")
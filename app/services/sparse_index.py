@@ -0,0 +1,181 @@
+import json
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document as ChunkDocument
+import logging
+
+from app.services.vector_index import chunk_id, chunk_key
+
+logger = logging.getLogger(__name__)
+
+# "-" and "_" are part of tokens so identifiers like E-1042 or SKU_88 match as a whole
+TOKENIZER = "unicode61 tokenchars '-_'"
+QUERY_TERM_PATTERN = re.compile(r"[\w\-]+")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS chunk_meta (
+    id INTEGER PRIMARY KEY,
+    partition TEXT NOT NULL,
+    -- the chunk's chunk_id(): its hash, prefixed with its document id when it has one
+    chunk_hash TEXT NOT NULL,
+    document_id INTEGER,
+    metadata TEXT NOT NULL,
+    UNIQUE (partition, chunk_hash)
+);
+CREATE INDEX IF NOT EXISTS ix_chunk_meta_document_id ON chunk_meta (document_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_text USING fts5(content, tokenize="{TOKENIZER}");
+"""
+
+
+class SparseIndex:
+    """
+    A BM25 keyword index over chunks, kept in SQLite FTS5.
+
+    Chunks are grouped by the same partitions as the vector index and searched with
+    the same partition -> filter selections; the only filter supported is the
+    {"document_id": {"$in": [...]}} filter used for the uploader and legacy collections.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per thread; WAL lets searches run while a document is indexed
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def add_documents(self, partition: str, chunks: List[ChunkDocument]):
+        """
+        This function indexes chunks of a partition; chunks already indexed there are skipped.
+        """
+        with self._write_lock, self._connection() as connection:
+            for chunk in chunks:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO chunk_meta (partition, chunk_hash, document_id, metadata) VALUES (?, ?, ?, ?)",
+                    (partition, chunk_id(chunk), chunk.metadata.get("document_id"), json.dumps(chunk.metadata))
+                )
+                if cursor.rowcount:
+                    connection.execute(
+                        "INSERT INTO chunk_text (rowid, content) VALUES (?, ?)",
+                        (cursor.lastrowid, chunk.page_content)
+                    )
+
+    def _delete(self, condition: str, parameters: Sequence[Any]):
+        with self._write_lock, self._connection() as connection:
+            connection.execute(
+                f"DELETE FROM chunk_text WHERE rowid IN (SELECT id FROM chunk_meta WHERE {condition})",
+                parameters
+            )
+            connection.execute(f"DELETE FROM chunk_meta WHERE {condition}", parameters)
+
+    def delete_partition(self, partition: str):
+        self._delete("partition = ?", (partition,))
+
+    def delete_where(self, partition: str, where: Dict[str, Any]):
+        self._delete("partition = ? AND document_id = ?", (partition, where["document_id"]))
+
+    @staticmethod
+    def _match_expression(query: str) -> Optional[str]:
+        terms = dict.fromkeys(term.lower() for term in QUERY_TERM_PATTERN.findall(query))
+        if not terms:
+            return None
+        return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+    @staticmethod
+    def _partition_condition(
+        partitions: Dict[str, Optional[Dict[str, Any]]]
+    ) -> Tuple[str, List[Any]]:
+        # lists are bound as one JSON array each, so any number of partitions or
+        # documents stays within SQLite's limit on bound parameters
+        clauses, parameters = [], []
+        unfiltered, filtered = [], []
+        for name, where in partitions.items():
+            if where is None:
+                unfiltered.append(name)
+                continue
+            document_ids = where.get("document_id", {}).get("$in") if isinstance(where.get("document_id"), dict) else None
+            if document_ids is None or len(where) != 1:
+                raise ValueError(f"Unsupported sparse index filter: {where}")
+            filtered.extend([name, document_id] for document_id in document_ids)
+        if unfiltered:
+            clauses.append("m.partition IN (SELECT value FROM json_each(?))")
+            parameters.append(json.dumps(unfiltered))
+        if filtered:
+            clauses.append(
+                "(m.partition, m.document_id) IN "
+                "(SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?))"
+            )
+            parameters.append(json.dumps(filtered))
+        return " OR ".join(clauses), parameters
+
+    def search_with_scores(
+        self,
+        partitions: Dict[str, Optional[Dict[str, Any]]],
+        query: str,
+        k: int
+    ) -> List[Tuple[ChunkDocument, float]]:
+        """
+        This function returns the k chunks of the selected partitions that best match
+        the query's terms with their BM25 scores (lower is better, as FTS5 reports them).
+        """
+        expression = self._match_expression(query)
+        if expression is None or not partitions:
+            return []
+        condition, parameters = self._partition_condition(partitions)
+        rows = self._connection().execute(
+            f"""
+            SELECT t.content, m.metadata, bm25(chunk_text) AS score
+            FROM chunk_text AS t JOIN chunk_meta AS m ON m.id = t.rowid
+            WHERE chunk_text MATCH ? AND ({condition})
+            ORDER BY score
+            LIMIT ?
+            """,
+            [expression, *parameters, k]
+        ).fetchall()
+        return [
+            (ChunkDocument(page_content=content, metadata=json.loads(metadata)), score)
+            for content, metadata, score in rows
+        ]
+
+    def search(
+        self,
+        partitions: Dict[str, Optional[Dict[str, Any]]],
+        query: str,
+        k: int
+    ) -> List[ChunkDocument]:
+        return [doc for doc, _ in self.search_with_scores(partitions, query, k)]
+
+
+def reciprocal_rank_fusion(
+    rankings: List[Tuple[List[ChunkDocument], float]],
+    k: int,
+    rrf_k: int = 60
+) -> List[ChunkDocument]:
+    """
+    This function fuses ranked chunk lists, each given with its weight, by weighted
+    reciprocal rank: a chunk scores sum(weight / (rrf_k + rank)) over the lists it
+    appears in. The k best chunks are returned, best first.
+    """
+    scores: Dict[str, float] = {}
+    chunks: Dict[str, ChunkDocument] = {}
+    for docs, weight in rankings:
+        if weight <= 0:
+            continue
+        for rank, doc in enumerate(docs, start=1):
+            key = chunk_key(doc)
+            chunks.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [chunks[key] for key in best]
@@ -0,0 +1,337 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from langchain.schema.embeddings import Embeddings
+from langchain.schema import Document as ChunkDocument
+
+from app.services.embedding_cache import content_hash
+import logging
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks on this platform
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# the single collection every chunk went into before the index was partitioned
+LEGACY_PARTITION = "langchain"
+# collection metadata flag set once backfill_metadata has stamped a partition's chunks
+BACKFILL_MARKER = "owners_backfilled"
+# advisory lock in the Chroma directory: shared by API servers, exclusive for bulk loads
+INDEX_LOCK_FILE = ".index.lock"
+
+
+class IndexLockedError(Exception):
+    """Raised when the index directory is locked by a process it cannot share it with."""
+
+
+def lock_index_directory(persist_directory: str, exclusive: bool = False):
+    """
+    This function takes the advisory lock on a Chroma directory and returns the open
+    lock file, which holds it until closed. chromadb's PersistentClient does not
+    support other processes writing to its directory, so API servers take the lock
+    shared and the bulk loader exclusively; whichever comes second is refused.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    lock_file = open(os.path.join(persist_directory, INDEX_LOCK_FILE), "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise IndexLockedError(
+                f"{persist_directory} is in use by "
+                + ("a running API server" if exclusive else "a bulk ingestion run")
+            )
+    return lock_file
+
+
+def chunk_key(doc: ChunkDocument) -> str:
+    """
+    This function returns a chunk's content hash, computed for chunks indexed without one.
+    """
+    return doc.metadata.get("chunk_hash") or content_hash(doc.page_content)
+
+
+def chunk_id(doc: ChunkDocument) -> str:
+    """
+    This function returns the id a chunk is stored under: its content hash, prefixed
+    with its document id when it has one, so documents sharing a partition can hold
+    the same passage without overwriting each other's copy.
+    """
+    document_id = doc.metadata.get("document_id")
+    return f"{document_id}:{chunk_key(doc)}" if document_id is not None else chunk_key(doc)
+
+
+def unique_chunks(hits: List[Tuple[ChunkDocument, float]], k: int) -> List[Tuple[ChunkDocument, float]]:
+    """
+    This function keeps the first (closest) hit of each distinct chunk, up to k hits.
+    """
+    seen, unique = set(), []
+    for doc, score in hits:
+        key = chunk_key(doc)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append((doc, score))
+        if len(unique) == k:
+            break
+    return unique
+
+
+def persist_required() -> bool:
+    """
+    This function tells whether writes need an explicit persist() to reach disk.
+    chromadb 0.4 and later write through on every upsert and make persist() a no-op.
+    """
+    from importlib.metadata import version
+
+    major, minor = (int(part) for part in version("chromadb").split(".")[:2])
+    return (major, minor) < (0, 4)
+
+
+def legacy_backfill_pending(persist_directory: str) -> bool:
+    """
+    This function tells whether the legacy collection exists and has not been marked
+    as backfilled yet. It opens a bare Chroma client, so no embedding model is loaded.
+    """
+    import chromadb
+
+    try:
+        collection = chromadb.PersistentClient(path=persist_directory).get_collection(LEGACY_PARTITION)
+    except ValueError:
+        return False
+    return not (collection.metadata or {}).get(BACKFILL_MARKER)
+
+
+def uploader_partition_name(uploader_id: int) -> str:
+    """
+    This function returns the partition (Chroma collection) holding an uploader's documents.
+    """
+    return f"uploader_{uploader_id}"
+
+
+def is_document_partition(name: str) -> bool:
+    """
+    This function tells whether a partition holds a single document's content, as
+    partitions created before documents were grouped per uploader do.
+    """
+    return name.startswith("doc_")
+
+
+class PartitionedIndex:
+    """
+    A vector index split into one Chroma collection per uploader.
+
+    All partitions share one persistent Chroma client. Searches fan out over the
+    selected partitions in parallel, each with its own optional metadata filter,
+    and the per-partition top-k lists are merged by distance, so a search costs
+    one HNSW query per uploader rather than per document. Deleting a document
+    deletes its chunks by document_id from its uploader's collection. At most
+    `max_open_partitions` collection handles are kept open, least recently used
+    first out.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embedding_function: Embeddings,
+        search_workers: int = 8,
+        max_open_partitions: int = 256
+    ):
+        import chromadb
+
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.max_open_partitions = max_open_partitions
+        self._client = chromadb.PersistentClient(path=persist_directory)
+        self._partitions: "OrderedDict[str, Chroma]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._search_executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="index-search")
+
+    def _open(self, name: str, create: bool) -> Optional["Chroma"]:
+        from langchain.vectorstores import Chroma
+
+        with self._lock:
+            store = self._partitions.get(name)
+            if store is not None:
+                self._partitions.move_to_end(name)
+                return store
+        # opening a collection reads the sysdb, so it happens outside the lock
+        if not create:
+            try:
+                self._client.get_collection(name)
+            except ValueError:
+                return None
+        store = Chroma(
+            collection_name=name,
+            embedding_function=self.embedding_function,
+            persist_directory=self.persist_directory,
+            client=self._client
+        )
+        with self._lock:
+            store = self._partitions.setdefault(name, store)
+            self._partitions.move_to_end(name)
+            while len(self._partitions) > self.max_open_partitions:
+                self._partitions.popitem(last=False)
+        return store
+
+    def partition(self, name: str) -> "Chroma":
+        """
+        This function returns a partition's store, creating the collection if needed.
+        """
+        return self._open(name, create=True)
+
+    def add_documents(self, name: str, chunks: List[ChunkDocument]) -> List[str]:
+        """
+        This function adds chunks to a partition. Chunks carrying a `chunk_hash` are
+        stored under their `chunk_id`, so adding the same chunk of a document again
+        is a no-op.
+        """
+        ids = [chunk_id(chunk) for chunk in chunks] if all(
+            "chunk_hash" in chunk.metadata for chunk in chunks
+        ) else None
+        return self.partition(name).add_documents(chunks, ids=ids)
+
+    def add_embeddings(self, name: str, chunks: List[ChunkDocument], embeddings: List[List[float]]):
+        """
+        This function upserts chunks whose embeddings were computed elsewhere (e.g. by
+        bulk ingestion workers), keyed by their `chunk_id`.
+        """
+        self.partition(name)._collection.upsert(
+            ids=[chunk_id(chunk) for chunk in chunks],
+            embeddings=embeddings,
+            metadatas=[chunk.metadata for chunk in chunks],
+            documents=[chunk.page_content for chunk in chunks]
+        )
+
+    def documents_with_chunks(self, name: str, batch_size: int = 1000) -> Set[int]:
+        """
+        This function returns the document ids carried by a partition's chunks.
+        """
+        document_ids, offset = set(), 0
+        collection = self._client.get_collection(name)
+        while True:
+            page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                return document_ids
+            document_ids.update(
+                metadata["document_id"] for metadata in page["metadatas"] if metadata and "document_id" in metadata
+            )
+            offset += len(page["ids"])
+
+    def backfill_metadata(
+        self,
+        name: str,
+        owners: Dict[str, List[Dict[str, Any]]],
+        batch_size: int = 1000
+    ) -> Tuple[int, Set[int]]:
+        """
+        This function merges owner metadata (document and uploader ids) into a
+        partition's chunks that have no document_id, matching chunks on their content
+        hash. `owners[hash]` lists one owner per copy of that passage expected in the
+        partition; each unstamped copy found takes the next one. It returns the number
+        of chunks updated and the ids of the documents stamped.
+        """
+        collection = self._client.get_collection(name)
+        updated, stamped, offset = 0, set(), 0
+        while True:
+            page = collection.get(include=["metadatas", "documents"], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                return updated, stamped
+            ids, metadatas = [], []
+            for chunk_id, metadata, text in zip(page["ids"], page["metadatas"], page["documents"]):
+                metadata = metadata or {}
+                if "document_id" in metadata:
+                    continue
+                candidates = owners.get(metadata.get("chunk_hash") or content_hash(text))
+                if candidates:
+                    owner = candidates.pop(0)
+                    ids.append(chunk_id)
+                    metadatas.append({**metadata, **owner})
+                    stamped.add(owner["document_id"])
+            if ids:
+                collection.update(ids=ids, metadatas=metadatas)
+            updated += len(ids)
+            offset += len(page["ids"])
+
+    def mark_backfilled(self, name: str):
+        """
+        This function records on a partition that its chunks all carry their owners.
+        """
+        collection = self._client.get_collection(name)
+        collection.modify(metadata={**(collection.metadata or {}), BACKFILL_MARKER: True})
+
+    def persist(self, name: str):
+        store = self._open(name, create=False)
+        if store is not None:
+            store.persist()
+
+    def _search_partition(
+        self,
+        name: str,
+        embedding: List[float],
+        k: int,
+        where: Optional[Dict[str, Any]]
+    ) -> List[Tuple[ChunkDocument, float]]:
+        store = self._open(name, create=False)
+        if store is None:
+            # e.g. a document whose ingestion has not written any chunk yet
+            return []
+        return store.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=where)
+
+    def search_with_scores(
+        self,
+        partitions: Dict[str, Optional[Dict[str, Any]]],
+        embedding: List[float],
+        k: int
+    ) -> List[Tuple[ChunkDocument, float]]:
+        """
+        This function searches each partition (name -> metadata filter or None) and
+        returns the overall k closest distinct chunks with their distances, closest first.
+        Identical chunks from different documents (or repeated in the legacy
+        collection) are returned once.
+        """
+        if not partitions:
+            return []
+        if len(partitions) == 1:
+            name, where = next(iter(partitions.items()))
+            return unique_chunks(self._search_partition(name, embedding, k, where), k)
+        futures = [
+            self._search_executor.submit(self._search_partition, name, embedding, k, where)
+            for name, where in partitions.items()
+        ]
+        candidates = [hit for future in futures for hit in future.result()]
+        return unique_chunks(sorted(candidates, key=lambda hit: hit[1]), k)
+
+    def search(
+        self,
+        partitions: Dict[str, Optional[Dict[str, Any]]],
+        embedding: List[float],
+        k: int
+    ) -> List[ChunkDocument]:
+        return [doc for doc, _ in self.search_with_scores(partitions, embedding, k)]
+
+    def delete_partition(self, name: str):
+        """
+        This function drops a partition and all of its chunks.
+        """
+        with self._lock:
+            self._partitions.pop(name, None)
+            try:
+                self._client.delete_collection(name)
+            except ValueError:
+                return
+        logger.info("Partition %s deleted", name)
+
+    def delete_where(self, name: str, where: Dict[str, Any]):
+        """
+        This function deletes the chunks matching a metadata filter from a partition.
+        """
+        store = self._open(name, create=False)
+        if store is not None:
+            store._collection.delete(where=where)
@@ -0,0 +1,41 @@
+"""
+Micro-benchmark of authorization decisions per second, with and without the decision cache.
+
+Run from the repository root:
+    python -m benchmarks.bench_authorization [iterations]
+"""
+import sys
+import time
+
+from app.models.user import User
+from app.models.document import Document  # noqa: F401 - registers the User.documents relationship
+from app.auth.authorization import authorize, init_oso, oso
+
+CHECKS = [
+    ("read", "document"),
+    ("search", "document"),
+    ("use", "rag"),
+    ("upload", "document"),
+    ("update", "user_role"),
+]
+
+
+def run(label: str, check, users, iterations: int):
+    start = time.perf_counter()
+    for i in range(iterations):
+        user = users[i % len(users)]
+        action, resource = CHECKS[i % len(CHECKS)]
+        check(user, action, resource)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {iterations / elapsed:>14,.0f} decisions/sec ({elapsed * 1e6 / iterations:.2f} us/decision)")
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    init_oso()
+    users = [
+        User(id=i, username=f"user{i}", role=role, is_active=True)
+        for i, role in enumerate(["user", "moderator", "admin"] * 10)
+    ]
+    run("uncached", oso.is_allowed, users, iterations)
+    run("cached", authorize, users, iterations)
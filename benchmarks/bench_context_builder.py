@@ -0,0 +1,114 @@
+"""
+Context assembly benchmark: naive join of retrieved chunks against the
+token-budgeted context builder.
+
+Run from the repository root:
+    python -m benchmarks.bench_context_builder [--num-docs 200] [--top-k 5 10 20]
+        [--budgets 0 1500 3000] [--prefill-tokens-per-sec 2000]
+
+The fixture corpus is generated deterministically: every document states one
+fact ("The error code for the <system> <component> is E-<code>.") amid filler
+paragraphs, and a share of documents also exist as lightly edited revisions.
+Documents are split like process_document and retrieved with the BM25 keyword
+index, so no embedding model is needed. For each top_k and budget the table reports prompt
+context tokens, fact recall (the queried code is still in the context), the time
+to assemble, and the LLM prefill time those tokens would cost at the given rate.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from langchain.schema import Document as ChunkDocument
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.services.context_builder import assemble_context, count_tokens
+from app.services.embedding_cache import content_hash
+from app.services.sparse_index import SparseIndex
+
+SYSTEMS = ["billing", "shipping", "login", "search", "payments", "inventory", "reporting", "messaging"]
+COMPONENTS = ["gateway", "scheduler", "worker", "cache", "importer", "exporter", "validator", "api"]
+FILLER = ["the", "service", "team", "reviewed", "logs", "during", "rollout", "and", "observed", "that",
+          "requests", "were", "retried", "after", "timeouts", "on", "the", "primary", "cluster", "while",
+          "operators", "monitored", "latency", "dashboards", "for", "regressions", "in", "production"]
+
+
+def filler_sentence(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(FILLER) for _ in range(rng.randint(low, high))).capitalize() + "."
+
+
+def fixture_corpus(num_docs: int, duplicate_share: float = 0.3, distractor_share: float = 0.0, seed: int = 0):
+    """
+    Generates the documents as (name, text) pairs and one (question, code) fact per
+    original document. A `distractor_share` of documents also get a paragraph that
+    mentions another system, component, "error" and "code" in separate sentences.
+    """
+    rng = random.Random(seed)
+    docs, facts = [], []
+    for number in range(num_docs):
+        system, component = rng.choice(SYSTEMS), rng.choice(COMPONENTS)
+        code = f"E-{rng.randint(1000, 9999)}"
+        paragraphs = [filler_sentence(rng, 60, 140) for _ in range(8)]
+        paragraphs.insert(rng.randint(1, 6), f"The error code for the {system} {component} is {code}.")
+        if distractor_share and rng.random() < distractor_share:
+            other_system, other_component = rng.choice(SYSTEMS), rng.choice(COMPONENTS)
+            paragraphs.insert(rng.randint(1, 7), " ".join([
+                f"The {other_system} team owns this runbook.", filler_sentence(rng, 10, 20),
+                f"Every {other_component} error is paged to the {other_system} rotation.", filler_sentence(rng, 10, 20),
+                f"Status code dashboards cover the {other_component}.",
+            ]))
+        text = "\n\n".join(paragraphs)
+        docs.append((f"doc_{number}", text))
+        facts.append((f"What is the error code for the {system} {component}", code))
+        if rng.random() < duplicate_share:
+            # a lightly edited revision uploaded as another document
+            revised = [
+                paragraph.replace(" the ", " a ", 1) if not paragraph.startswith("The error code") else paragraph
+                for paragraph in paragraphs
+            ]
+            docs.append((f"doc_{number}_revised", "\n\n".join(revised)))
+    return docs, facts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-docs", type=int, default=200)
+    parser.add_argument("--num-queries", type=int, default=100)
+    parser.add_argument("--top-k", nargs="+", type=int, default=[5, 10, 20])
+    parser.add_argument("--budgets", nargs="+", type=int, default=[0, 1500, 3000])
+    parser.add_argument("--prefill-tokens-per-sec", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
+    index = SparseIndex(os.path.join(tempfile.mkdtemp(), "sparse_index.db"))
+    docs, facts = fixture_corpus(args.num_docs)
+    for document_id, (name, text) in enumerate(docs):
+        chunks = splitter.split_documents([ChunkDocument(page_content=text, metadata={"source": name})])
+        for chunk in chunks:
+            chunk.metadata.update({"document_id": document_id, "chunk_hash": content_hash(chunk.page_content)})
+        index.add_documents("corpus", chunks)
+    queries = random.Random(1).sample(facts, min(args.num_queries, len(facts)))
+    print(f"{len(docs)} documents, {len(queries)} queries, tokenizer: {count_tokens.__module__}.count_tokens")
+
+    print(f"{'top_k':>5} {'builder':<14} {'tokens':>8} {'saved':>7} {'recall':>7} {'build ms':>9} {'prefill ms':>11}")
+    for top_k in args.top_k:
+        retrieved = [(index.search({"corpus": None}, question, top_k), code) for question, code in queries]
+        naive_tokens = statistics.mean(count_tokens("\n\n".join(doc.page_content for doc in hits)) for hits, _ in retrieved)
+        naive_recall = statistics.mean(code in "\n\n".join(doc.page_content for doc in hits) for hits, code in retrieved)
+        print(f"{top_k:>5} {'naive join':<14} {naive_tokens:>8.0f} {'':>7} {naive_recall:>7.2f} {'':>9} "
+              f"{naive_tokens / args.prefill_tokens_per_sec * 1000:>11.1f}")
+        for budget in args.budgets:
+            tokens, recall, build_ms = [], [], []
+            for hits, code in retrieved:
+                started = time.perf_counter()
+                assembled = assemble_context(hits, budget)
+                build_ms.append((time.perf_counter() - started) * 1000)
+                tokens.append(assembled["tokens"])
+                recall.append(code in assembled["context"])
+            mean_tokens = statistics.mean(tokens)
+            label = f"budget {budget}" if budget else "no budget"
+            print(f"{top_k:>5} {label:<14} {mean_tokens:>8.0f} {1 - mean_tokens / naive_tokens:>7.0%} "
+                  f"{statistics.mean(recall):>7.2f} {statistics.mean(build_ms):>9.2f} "
+                  f"{mean_tokens / args.prefill_tokens_per_sec * 1000:>11.1f}")
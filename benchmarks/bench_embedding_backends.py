@@ -0,0 +1,98 @@
+"""
+Embedding backend benchmark: throughput, query latency and recall@k against torch.
+
+Run from the repository root:
+    python -m benchmarks.bench_embedding_backends [--backends torch onnx onnx-int8]
+        [--corpus-dir DIR] [--num-docs 2000] [--num-queries 200] [--k 10]
+
+The corpus is either the .txt files under --corpus-dir (one passage per
+paragraph) or a deterministic synthetic corpus. Recall@k is the overlap of
+each backend's top-k neighbours with the torch backend's top-k neighbours.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.embedding_backends import create_embeddings, EMBEDDING_BACKENDS
+
+TOPICS = ["invoice", "shipment", "login", "database", "refund", "firmware", "warranty", "network", "billing", "sensor"]
+VERBS = ["fails", "is delayed", "returns error", "needs approval", "was updated", "times out", "is duplicated"]
+DETAILS = ["after the last release", "for enterprise customers", "on the staging cluster", "when the cache is cold",
+           "during peak hours", "with code E{code}", "for SKU-{code}", "in the EU region"]
+
+
+def synthetic_corpus(num_docs: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        f"The {rng.choice(TOPICS)} {rng.choice(VERBS)} {rng.choice(DETAILS).format(code=rng.randint(100, 999))}. "
+        f"Operators reported the {rng.choice(TOPICS)} issue {rng.choice(DETAILS).format(code=rng.randint(100, 999))}."
+        for _ in range(num_docs)
+    ]
+
+
+def load_corpus(directory: str):
+    passages = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.endswith(".txt"):
+                with open(os.path.join(root, name), encoding="utf-8", errors="ignore") as f:
+                    passages.extend(p.strip() for p in f.read().split("\n\n") if p.strip())
+    return passages
+
+
+def top_k(corpus_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    scores = query_vectors @ corpus_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--model-dir", default=os.path.join(tempfile.gettempdir(), "onnx_models", "all-MiniLM-L6-v2"))
+    parser.add_argument("--corpus-dir", default=None)
+    parser.add_argument("--num-docs", type=int, default=2000)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus_dir) if args.corpus_dir else synthetic_corpus(args.num_docs)
+    queries = random.Random(1).sample(corpus, min(args.num_queries, len(corpus)))
+    queries = [" ".join(query.split()[:8]) for query in queries]
+    print(f"corpus: {len(corpus)} passages, {len(queries)} queries, k={args.k}")
+
+    results = {}
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        embeddings = create_embeddings(backend, args.model, args.batch_size, args.model_dir)
+        embeddings.embed_documents(corpus[:args.batch_size])  # warm up
+
+        start = time.perf_counter()
+        corpus_vectors = np.asarray(embeddings.embed_documents(corpus), dtype=np.float32)
+        docs_per_sec = len(corpus) / (time.perf_counter() - start)
+
+        latencies = []
+        query_vectors = []
+        for query in queries:
+            start = time.perf_counter()
+            query_vectors.append(embeddings.embed_query(query))
+            latencies.append((time.perf_counter() - start) * 1000)
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        results[backend] = (corpus_vectors, query_vectors, docs_per_sec, latencies)
+
+    base_corpus, base_queries = results["torch"][0], results["torch"][1]
+    base_top = top_k(base_corpus, base_queries, args.k)
+    print(f"{'backend':<10} {'docs/sec':>10} {'query p50 ms':>13} {'query p95 ms':>13} {'cos vs torch':>13} {'recall@k':>9}")
+    for backend, (corpus_vectors, query_vectors, docs_per_sec, latencies) in results.items():
+        cosine = float(np.mean(np.sum(corpus_vectors * base_corpus, axis=1)
+                               / (np.linalg.norm(corpus_vectors, axis=1) * np.linalg.norm(base_corpus, axis=1))))
+        backend_top = top_k(corpus_vectors, query_vectors, args.k)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(backend_top, base_top)])
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{backend:<10} {docs_per_sec:>10.1f} {statistics.median(latencies):>13.2f} {p95:>13.2f} "
+              f"{cosine:>13.4f} {recall:>9.3f}")
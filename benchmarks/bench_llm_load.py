@@ -0,0 +1,164 @@
+"""
+Load test of /rag/query end to end against the stub LLM provider.
+
+Run from the repository root:
+    python -m benchmarks.bench_llm_load [--concurrency 1 8 32 64] [--requests 100]
+        [--latency-ms 100] [--tokens-per-second 500] [--answer-tokens 64]
+        [--failure-rate 0] [--num-docs 200]
+
+Requests go through the full app (JWT authentication, authorization, retrieval,
+context assembly and generation) in-process over httpx.ASGITransport, with
+LLM_PROVIDER=stub so every answer costs a known latency + answer_tokens /
+tokens_per_second. A throwaway database and document store are seeded with the
+fixture corpus of bench_context_builder, indexed for BM25 retrieval so no
+embedding model is needed; the answer cache is disabled so every request
+generates. For each concurrency level the table reports throughput, latency
+percentiles and the responses by status. With a failure rate, 502s are stub
+failures and 503s are calls the circuit breaker rejected.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+WORK_DIRECTORY = tempfile.mkdtemp()
+
+
+def configure(args):
+    # read at import time by the app modules, so set before importing them
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{WORK_DIRECTORY}/app.db",
+        "DOCUMENT_STORE_PATH": os.path.join(WORK_DIRECTORY, "store"),
+        "LLM_PROVIDER": "stub",
+        "LLM_STUB_LATENCY_MS": str(args.latency_ms),
+        "LLM_STUB_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "LLM_STUB_ANSWER_TOKENS": str(args.answer_tokens),
+        "LLM_STUB_FAILURE_RATE": str(args.failure_rate),
+        "RAG_RETRIEVAL_STRATEGY": "bm25",
+        "ANSWER_CACHE_ENABLED": "false",
+        "BCRYPT_ROUNDS": "4",
+    })
+
+
+def seed_documents(num_docs: int, uploader_id: int):
+    from langchain.schema import Document as ChunkDocument
+
+    from app.database import SessionLocal
+    from app.models.document import Document
+    from app.services.embedding_cache import content_hash
+    from app.services.rag_service import get_sparse_index, text_splitter
+    from app.services.vector_index import uploader_partition_name
+    from benchmarks.bench_context_builder import fixture_corpus
+
+    docs, facts = fixture_corpus(num_docs)
+    db = SessionLocal()
+    try:
+        for name, text in docs:
+            row = Document(
+                title=name,
+                file_path=name,
+                file_type="txt",
+                uploader_id=uploader_id,
+                collection_name=uploader_partition_name(uploader_id)
+            )
+            db.add(row)
+            db.flush()
+            chunks = text_splitter.split_documents([ChunkDocument(page_content=text, metadata={"source": name})])
+            for chunk in chunks:
+                chunk.metadata.update({"document_id": row.id, "uploader_id": uploader_id, "chunk_hash": content_hash(chunk.page_content)})
+            get_sparse_index().add_documents(row.collection_name, chunks)
+        db.commit()
+    finally:
+        db.close()
+    return [question for question, _ in facts]
+
+
+async def login(client, username: str):
+    from app.database import SessionLocal
+    from app.models.user import User
+
+    await client.post("/auth/register", json={"username": username, "email": f"{username}@example.com", "password": "secret1"})
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        user.role = "admin"
+        db.commit()
+        user_id = user.id
+    finally:
+        db.close()
+    response = await client.post("/auth/token", data={"username": username, "password": "secret1"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}, user_id
+
+
+async def run_level(client, headers, questions, concurrency: int, total: int):
+    latencies, statuses = [], Counter()
+    issued = iter(range(total))
+
+    async def worker():
+        for number in issued:
+            started = time.perf_counter()
+            response = await client.post(
+                "/rag/query",
+                headers=headers,
+                json={"query": f"{questions[number % len(questions)]} ({number})", "top_k": 5}
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - started, latencies, statuses
+
+
+def percentile(values, share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+async def main(args):
+    import httpx
+
+    from app.main import app
+    from app.database import init_db
+    from app.auth.authorization import init_oso
+    from app.services.rag_service import RAG_MAX_CONCURRENT_GENERATIONS, llm_status
+
+    init_db()
+    init_oso()
+    # per-request INFO logs would dominate the measured overhead
+    logging.disable(logging.INFO)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120) as client:
+        headers, user_id = await login(client, "loadtest")
+        questions = seed_documents(args.num_docs, user_id)
+        ideal_ms = args.latency_ms + 1000 * (args.answer_tokens - 1) / args.tokens_per_second
+        print(f"{args.num_docs} documents, stub generation {ideal_ms:.0f} ms, "
+              f"RAG_MAX_CONCURRENT_GENERATIONS={RAG_MAX_CONCURRENT_GENERATIONS}")
+        await run_level(client, headers, questions, 1, 3)
+
+        print(f"{'concurrency':>11} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'overhead p50':>13}  statuses")
+        for concurrency in args.concurrency:
+            elapsed, latencies, statuses = await run_level(client, headers, questions, concurrency, args.requests)
+            p50 = statistics.median(latencies)
+            print(f"{concurrency:>11} {len(latencies) / elapsed:>8.1f} {p50:>8.0f} {percentile(latencies, 0.95):>8.0f} "
+                  f"{percentile(latencies, 0.99):>8.0f} {p50 - ideal_ms:>13.0f}  "
+                  f"{', '.join(f'{code}: {count}' for code, count in sorted(statuses.items()))}")
+        print(f"LLM provider: {llm_status()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--num-docs", type=int, default=200)
+    args = parser.parse_args()
+
+    configure(args)
+    asyncio.run(main(args))
@@ -0,0 +1,104 @@
+"""
+PDF parsing benchmark: PyPDFLoader.load() against the lazy page pipeline.
+
+Run from the repository root:
+    python -m benchmarks.bench_pdf_parsing [--pdf FILE] [--pages 400] [--processes 1 2 4]
+
+Without --pdf a synthetic text PDF is generated. For each process count the
+pipeline's pages/sec and the peak Python heap of the consuming process while
+iterating (pages are consumed and dropped, as process_document does) are
+reported. Parsing only scales with processes up to the number of cores.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from app.services import document_pages
+
+WORDS = ["invoice", "shipment", "login", "database", "refund", "firmware", "warranty", "network",
+         "billing", "sensor", "customer", "release", "cluster", "region", "approval", "timeout"]
+
+
+def write_sample_pdf(path: str, num_pages: int, lines_per_page: int = 45, seed: int = 0):
+    """Writes a minimal multi-page PDF with one Helvetica text stream per page."""
+    rng = random.Random(seed)
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = len(objects) + 2 * num_pages + 1
+    page_ids = []
+    for number in range(num_pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        text = f"BT /F1 10 Tf 40 800 Td 14 TL (Page {number + 1}) Tj " + " ".join(f"T* ({line}) Tj" for line in lines) + " ET"
+        stream = text.encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, content, font)
+        ))
+    kids = b" ".join(b"%d 0 R" % page for page in page_ids)
+    assert add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, num_pages)) == pages_id
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+
+
+def measure(label: str, iterate):
+    start = time.perf_counter()
+    pages = iterate()
+    elapsed = time.perf_counter() - start
+    # tracing slows allocation down, so memory is measured on a separate pass
+    tracemalloc.start()
+    iterate()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {pages:>6} {pages / elapsed:>10.1f} {peak / 1024 / 1024:>14.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=None)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--processes", nargs="+", type=int, default=[1, 2, 4])
+    args = parser.parse_args()
+
+    pdf_path = args.pdf
+    if pdf_path is None:
+        pdf_path = os.path.join(tempfile.mkdtemp(), "sample.pdf")
+        write_sample_pdf(pdf_path, args.pages)
+    print(f"{pdf_path}: {document_pages.count_pdf_pages(pdf_path)} pages, {os.path.getsize(pdf_path) / 1024 / 1024:.1f} MB")
+    print(f"{'parser':<28} {'pages':>6} {'pages/sec':>10} {'peak heap MB':>14}")
+
+    def load_all():
+        from langchain.document_loaders import PyPDFLoader
+
+        return len(PyPDFLoader(pdf_path).load())
+
+    measure("PyPDFLoader.load", load_all)
+
+    for processes in args.processes:
+        document_pages.shutdown_parse_pool()
+        document_pages.PDF_PARSE_PROCESSES = processes
+        document_pages.PDF_PARSE_MAX_PENDING = 2 * processes
+        if processes > 1:
+            # start the pool outside the timing
+            document_pages._get_parse_pool().submit(int).result()
+        measure(f"pipeline, {processes} processes",
+                lambda: sum(1 for _ in document_pages.iter_pdf_pages(pdf_path)))
+    document_pages.shutdown_parse_pool()
@@ -0,0 +1,90 @@
+"""
+Rerank benchmark: the latency a rerank stage adds against the LLM time saved by
+answering from fewer, better chunks.
+
+Run from the repository root:
+    python -m benchmarks.bench_rerank [--num-docs 200] [--distractor-share 0.5]
+        [--candidates 20] [--top-k 5]
+        [--rerankers lexical cross-encoder] [--prefill-tokens-per-sec 2000]
+
+Documents come from the bench_context_builder fixture corpus, with distractor
+paragraphs that mention a query's terms in separate sentences, and are retrieved
+with the BM25 keyword index, so no embedding model is needed. Three setups are
+compared per query: retrieving `candidates` chunks straight into the prompt,
+retrieving only `top_k`, and retrieving `candidates` then reranking down to
+`top_k`. For each the table reports context tokens (after context assembly),
+fact recall, rerank time on a cold and a warm (cached) score cache, and the LLM
+prefill time the context would cost at the given rate. Rerankers whose model
+cannot be loaded (e.g. cross-encoder without sentence-transformers) are skipped.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from langchain.schema import Document as ChunkDocument
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.services.context_builder import assemble_context
+from app.services.embedding_cache import content_hash
+from app.services.reranker import create_reranker
+from app.services.sparse_index import SparseIndex
+from benchmarks.bench_context_builder import fixture_corpus
+
+
+def report(label: str, contexts, rerank_ms=None, warm_ms=None, prefill_rate: float = 2000.0):
+    tokens = statistics.mean(assembled["tokens"] for assembled, _ in contexts)
+    recall = statistics.mean(code in assembled["context"] for assembled, code in contexts)
+    prefill_ms = tokens / prefill_rate * 1000
+    cold = f"{statistics.mean(rerank_ms):.2f}" if rerank_ms else ""
+    warm = f"{statistics.mean(warm_ms):.2f}" if warm_ms else ""
+    total = prefill_ms + (statistics.mean(rerank_ms) if rerank_ms else 0)
+    print(f"{label:<28} {tokens:>8.0f} {recall:>7.2f} {cold:>9} {warm:>9} {prefill_ms:>11.1f} {total:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-docs", type=int, default=200)
+    parser.add_argument("--num-queries", type=int, default=100)
+    parser.add_argument("--distractor-share", type=float, default=0.5)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rerankers", nargs="+", default=["lexical", "cross-encoder"])
+    parser.add_argument("--model-name", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--prefill-tokens-per-sec", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
+    index = SparseIndex(os.path.join(tempfile.mkdtemp(), "sparse_index.db"))
+    docs, facts = fixture_corpus(args.num_docs, distractor_share=args.distractor_share)
+    for document_id, (name, text) in enumerate(docs):
+        chunks = splitter.split_documents([ChunkDocument(page_content=text, metadata={"source": name})])
+        for chunk in chunks:
+            chunk.metadata.update({"document_id": document_id, "chunk_hash": content_hash(chunk.page_content)})
+        index.add_documents("corpus", chunks)
+    queries = random.Random(1).sample(facts, min(args.num_queries, len(facts)))
+    retrieved = [(question, index.search({"corpus": None}, question, args.candidates), code) for question, code in queries]
+    print(f"{len(docs)} documents, {len(queries)} queries, {args.candidates} candidates -> top {args.top_k}")
+
+    print(f"{'setup':<28} {'tokens':>8} {'recall':>7} {'cold ms':>9} {'warm ms':>9} {'prefill ms':>11} {'total ms':>9}")
+    rate = args.prefill_tokens_per_sec
+    report(f"top {args.candidates}, no rerank", [(assemble_context(hits), code) for _, hits, code in retrieved], prefill_rate=rate)
+    report(f"top {args.top_k}, no rerank", [(assemble_context(hits[:args.top_k]), code) for _, hits, code in retrieved], prefill_rate=rate)
+    for name in args.rerankers:
+        try:
+            reranker = create_reranker(name, model_name=args.model_name)
+        except Exception as e:
+            print(f"{name:<28} skipped: {type(e).__name__}: {e}")
+            continue
+        contexts, cold_ms, warm_ms = [], [], []
+        for question, hits, code in retrieved:
+            started = time.perf_counter()
+            best = reranker.rerank(question, hits, args.top_k)
+            cold_ms.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            reranker.rerank(question, hits, args.top_k)
+            warm_ms.append((time.perf_counter() - started) * 1000)
+            contexts.append((assemble_context(best), code))
+        report(f"top {args.candidates} -> {args.top_k}, {name}", contexts, cold_ms, warm_ms, rate)
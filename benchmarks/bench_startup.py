@@ -0,0 +1,63 @@
+"""
+Startup benchmark: import time and peak RSS of a module in a fresh interpreter.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [--module app.main] [--runs 3]
+        [--max-seconds 3.0] [--max-rss-mb 300]
+
+Exits non-zero when a threshold is exceeded, so it can guard against
+heavy imports (torch, transformers, chromadb) creeping back into import time.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in ("torch", "transformers", "sentence_transformers", "chromadb") if name in sys.modules)
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": heavy,
+}}))
+"""
+
+
+def measure(module: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    parser.add_argument("--max-rss-mb", type=float, default=None)
+    args = parser.parse_args()
+
+    samples = [measure(args.module) for _ in range(args.runs)]
+    seconds = statistics.median(sample["seconds"] for sample in samples)
+    rss_mb = max(sample["rss_mb"] for sample in samples)
+    heavy = samples[-1]["heavy_modules"]
+    print(f"import {args.module}: {seconds:.2f}s median over {args.runs} runs, peak RSS {rss_mb:.0f} MB")
+    print(f"heavy modules loaded at import: {', '.join(heavy) or 'none'}")
+
+    failed = False
+    if args.max_seconds is not None and seconds > args.max_seconds:
+        print(f"FAIL: import time {seconds:.2f}s exceeds {args.max_seconds:.2f}s")
+        failed = True
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        print(f"FAIL: peak RSS {rss_mb:.0f} MB exceeds {args.max_rss_mb:.0f} MB")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,328 @@
+"""
+Script to bulk-ingest a directory or manifest of PDF/TXT documents.
+
+Files are copied into DOCUMENT_STORE_PATH, then parsed, split and embedded on a
+pool of worker processes; this process writes the chunks to the Chroma store and
+the rows to the documents table in batches. Identical files (and files already
+ingested) are stored and embedded once. Finished documents are recorded in a
+checkpoint file, so an interrupted run resumes where it stopped when started again
+with the same arguments.
+
+Usage:
+    python ingest_documents.py SOURCE --uploader-id ID [--workers N] [--batch-size N]
+        [--checkpoint FILE]
+
+SOURCE is a directory (searched recursively for .pdf and .txt files) or a JSON
+Lines manifest with one {"path": ..., "title": ..., "description": ...} object per
+line; relative paths are resolved against the manifest's directory.
+
+Stop the API servers before running it: chromadb's persistent client does not
+support several processes writing to one index, so the script refuses to start
+while a server holds the index directory (and servers refuse to start during a
+run). Restarted servers begin with empty answer caches and serve the new
+documents right away.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import get_context
+from typing import Any, Dict, List, Set
+
+from app.database import SessionLocal, init_db
+from app.models.user import User
+from app.models.document import Document
+
+SUPPORTED_FILE_TYPES = ("pdf", "txt")
+# largest number of chunks sent to Chroma in one upsert
+UPSERT_BATCH_SIZE = 5000
+
+
+def discover(source: str) -> List[Dict[str, Any]]:
+    """Lists the documents to ingest from a directory or a manifest."""
+    tasks = []
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.split('.')[-1].lower() in SUPPORTED_FILE_TYPES:
+                    path = os.path.abspath(os.path.join(root, name))
+                    tasks.append({"path": path, "title": os.path.splitext(name)[0], "description": None})
+        return tasks
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            path = os.path.abspath(os.path.join(base, entry["path"]))
+            if path.split('.')[-1].lower() not in SUPPORTED_FILE_TYPES:
+                print(f"Skipping line {line_number}: unsupported file type {path}")
+                continue
+            tasks.append({
+                "path": path,
+                "title": entry.get("title") or os.path.splitext(os.path.basename(path))[0],
+                "description": entry.get("description"),
+            })
+    return tasks
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Returns the source paths a previous run finished."""
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {json.loads(line)["path"] for line in f if line.strip()}
+
+
+def _init_worker():
+    # each worker embeds on one core; parallelism comes from the number of workers
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    os.environ.setdefault("EMBEDDING_ONNX_THREADS", "1")
+    os.environ["PDF_PARSE_PROCESSES"] = "1"
+    os.environ["EMBEDDING_PROCESSES"] = "0"
+
+
+def _hash_file(task: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services.rag_service import UPLOAD_CHUNK_SIZE
+
+    hasher = hashlib.sha256()
+    try:
+        with open(task["path"], "rb") as f:
+            for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                hasher.update(block)
+    except OSError as e:
+        return {**task, "error": str(e)}
+    return {**task, "content_hash": hasher.hexdigest()}
+
+
+def _embed_document(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Copies one document into the store, then parses, splits and embeds it."""
+    # imported here so the environment set by _init_worker applies
+    from app.services.rag_service import iter_page_chunks, get_embeddings
+
+    try:
+        if not os.path.exists(task["file_path"]):
+            partial_path = f"{task['file_path']}.part"
+            shutil.copyfile(task["path"], partial_path)
+            os.replace(partial_path, task["file_path"])
+        num_pages = 0
+        chunks = []
+        for page_chunks in iter_page_chunks(task["file_path"]):
+            num_pages += 1
+            chunks.extend(page_chunks)
+        embeddings = get_embeddings().embed_documents([chunk.page_content for chunk in chunks])
+    except Exception as e:
+        # no row refers to it yet; a later run copies it again
+        if os.path.exists(task["file_path"]):
+            os.unlink(task["file_path"])
+        return {**task, "error": str(e)}
+    return {
+        **task,
+        "num_pages": num_pages,
+        "chunks": chunks,
+        "embeddings": embeddings,
+    }
+
+
+class Progress:
+    def __init__(self, total: int):
+        self.total = total
+        self.documents = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.pages = 0
+        self.chunks = 0
+        self.started = time.perf_counter()
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        done = self.documents + self.duplicates + self.failed
+        rate = done / elapsed
+        eta = (self.total - done) / rate if rate else 0
+        print(
+            f"[{done}/{self.total}] {self.documents} indexed, {self.duplicates} duplicates, "
+            f"{self.failed} failed | {rate:.1f} docs/s, {self.pages / elapsed:.1f} pages/s, "
+            f"{self.chunks / elapsed:.1f} chunks/s | elapsed {elapsed:.0f}s, eta {eta:.0f}s",
+            flush=True
+        )
+
+
+def write_batch(db, index, sparse_index, results: List[Dict[str, Any]], uploader_id: int, checkpoint, progress: Progress):
+    """
+    Writes a batch of embedded documents: rows are inserted in one flush to get
+    their ids, chunks are upserted into the uploader's partition and added to the
+    keyword index, and the rows are committed (content_hash last, which marks them
+    complete) before checkpointing. If the batch fails, the chunks already written
+    for its rows are deleted, as the rolled back ids may be handed out again.
+    """
+    rows = [
+        Document(
+            title=result["title"],
+            description=result["description"],
+            file_path=result["file_path"],
+            file_type=result["file_type"],
+            uploader_id=uploader_id,
+            collection_name=result["collection_name"]
+        )
+        for result in results
+    ]
+    db.add_all(rows)
+    db.flush()
+    try:
+        for row, result in zip(rows, results):
+            for chunk in result["chunks"]:
+                chunk.metadata.update({"document_id": row.id, "uploader_id": uploader_id})
+            for start in range(0, len(result["chunks"]), UPSERT_BATCH_SIZE):
+                index.add_embeddings(
+                    result["collection_name"],
+                    result["chunks"][start:start + UPSERT_BATCH_SIZE],
+                    result["embeddings"][start:start + UPSERT_BATCH_SIZE]
+                )
+            sparse_index.add_documents(result["collection_name"], result["chunks"])
+            index.persist(result["collection_name"])
+            row.content_hash = result["content_hash"]
+        db.commit()
+    except Exception:
+        for row, result in zip(rows, results):
+            index.delete_where(result["collection_name"], {"document_id": row.id})
+            sparse_index.delete_where(result["collection_name"], {"document_id": row.id})
+        db.rollback()
+        raise
+
+    for row, result in zip(rows, results):
+        checkpoint.write(json.dumps({"path": result["path"], "content_hash": result["content_hash"], "document_id": row.id}) + "\n")
+        progress.documents += 1
+        progress.pages += result["num_pages"]
+        progress.chunks += len(result["chunks"])
+    checkpoint.flush()
+
+
+def write_duplicates(db, duplicates: List[Dict[str, Any]], uploader_id: int, checkpoint, progress: Progress):
+    """Inserts rows sharing the chunks and file of the document with the same content."""
+    from app.services.ingestion_jobs import find_duplicate_document
+
+    rows, recorded = [], []
+    for task in duplicates:
+        original = find_duplicate_document(db, task["content_hash"])
+        if original is None:
+            # its original failed to ingest
+            progress.failed += 1
+            continue
+        rows.append(Document(
+            title=task["title"],
+            description=task["description"],
+            file_path=original.file_path,
+            file_type=original.file_type,
+            uploader_id=uploader_id,
+            collection_name=original.collection_name,
+            content_hash=original.content_hash,
+            source_document_id=original.source_document_id or original.id
+        ))
+        recorded.append(task)
+    db.add_all(rows)
+    db.commit()
+    for row, task in zip(rows, recorded):
+        checkpoint.write(json.dumps({"path": task["path"], "content_hash": task["content_hash"], "document_id": row.id}) + "\n")
+        progress.duplicates += 1
+    checkpoint.flush()
+
+
+def ingest(source: str, uploader_id: int, workers: int, batch_size: int, checkpoint_path: str):
+    from app.services.ingestion_jobs import find_duplicate_document
+    from app.services.rag_service import DOCUMENT_STORE_PATH, CHROMA_PERSIST_DIRECTORY, get_sparse_index
+    from app.services.vector_index import PartitionedIndex, IndexLockedError, lock_index_directory, uploader_partition_name
+
+    try:
+        index_lock = lock_index_directory(CHROMA_PERSIST_DIRECTORY, exclusive=True)
+    except IndexLockedError as e:
+        print(f"{e}; stop the API servers before bulk ingestion.")
+        return False
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if db.query(User).filter(User.id == uploader_id).first() is None:
+            print(f"User with ID {uploader_id} not found!")
+            return False
+
+        tasks = discover(source)
+        done = load_checkpoint(checkpoint_path)
+        tasks = [task for task in tasks if task["path"] not in done]
+        print(f"{len(tasks)} documents to ingest ({len(done)} already done) with {workers} workers")
+        progress = Progress(len(tasks))
+        if not tasks:
+            return True
+
+        # the index is only written here; chunks arrive already embedded
+        index = PartitionedIndex(CHROMA_PERSIST_DIRECTORY, embedding_function=None)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"), initializer=_init_worker) as pool, \
+                open(checkpoint_path, "a") as checkpoint:
+            primaries, duplicates = [], []
+            seen_hashes = set()
+            for task in pool.map(_hash_file, tasks, chunksize=64):
+                if "error" in task:
+                    print(f"Failed to read {task['path']}: {task['error']}")
+                    progress.failed += 1
+                elif task["content_hash"] in seen_hashes or find_duplicate_document(db, task["content_hash"]):
+                    duplicates.append(task)
+                else:
+                    seen_hashes.add(task["content_hash"])
+                    file_type = task["path"].split('.')[-1].lower()
+                    primaries.append({
+                        **task,
+                        "file_type": file_type,
+                        "collection_name": uploader_partition_name(uploader_id),
+                        # named after the content, so a resumed run reuses the same file
+                        "file_path": os.path.join(DOCUMENT_STORE_PATH, f"{task['content_hash'][:32]}.{file_type}"),
+                    })
+            print(f"{len(primaries)} distinct documents to embed, {len(duplicates)} duplicates")
+
+            # bounded so finished documents never pile up in memory faster than they are written
+            pending, batch = set(), []
+            remaining = iter(primaries)
+            while True:
+                for task in remaining:
+                    pending.add(pool.submit(_embed_document, task))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    if "error" in result:
+                        print(f"Failed to ingest {result['path']}: {result['error']}")
+                        progress.failed += 1
+                    else:
+                        batch.append(result)
+                if len(batch) >= batch_size or (not pending and batch):
+                    write_batch(db, index, get_sparse_index(), batch, uploader_id, checkpoint, progress)
+                    batch = []
+                    progress.report()
+
+            write_duplicates(db, duplicates, uploader_id, checkpoint, progress)
+        progress.report()
+        return progress.failed == 0
+    finally:
+        db.close()
+        index_lock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory or JSON Lines manifest of documents")
+    parser.add_argument("--uploader-id", type=int, required=True, help="user recorded as the uploader")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=100, help="documents written per database transaction")
+    parser.add_argument("--checkpoint", default=None, help="defaults to <source>.ingest-checkpoint.jsonl")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or f"{os.path.abspath(args.source).rstrip(os.sep)}.ingest-checkpoint.jsonl"
+    ok = ingest(args.source, args.uploader_id, args.workers, args.batch_size, checkpoint_path)
+    sys.exit(0 if ok else 1)
@@ -31,6 +31,8 @@ def make_user_admin(user_id):
         
         # Update role to admin
         user.role = "admin"
+        # the commit bumps the user's version; running servers drop their cached
+        # principal within PRINCIPAL_CACHE_REVALIDATE_SECONDS
         db.commit()
         
         print(f"User {user.username} (ID: {user.id}) is now an admin!")